@@ -4,17 +4,34 @@
 
 import json
 import dateutil.parser
+import itertools
+from dateutil.rrule import rrule, rrulestr, DAILY, WEEKLY, MONTHLY
+from dateutil.relativedelta import relativedelta
 import babel
-import sys, datetime
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import os, sys, datetime, time, calendar, threading, functools, atexit, uuid
+from datetime import timedelta
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, abort, has_request_context, g, send_from_directory
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
 from flask_moment import Moment
-from sqlalchemy import func, desc   # desc is for descending order of venues & artists
+from sqlalchemy import func, desc, text, literal_column, event   # desc is for descending order of venues & artists
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR, aggregate_order_by
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from flask_sqlalchemy import SQLAlchemy
 import logging
-from logging import Formatter, FileHandler
+import click
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
+from prefix_index import PrefixIndex
+from metrics import Metrics
+from slow_queries import SlowQueryLog
+from structured_logging import start_pipeline
+from tracing import Tracer, BatchExporter
+from request_profiler import RequestProfiler
+from memory_profiler import MemoryProfiler
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -23,6 +40,10 @@ app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
 
+# compiled templates survive restarts, `flask compile-templates` fills the cache at deploy
+os.makedirs(app.config['JINJA_BYTECODE_CACHE_DIR'], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+
 # TODO: connect to a local postgresql database
 
 # app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False # moved to config.py 
@@ -31,16 +52,221 @@ db = SQLAlchemy(app)
 
 migrate = Migrate(app, db)  # Instantiate to start using migrate commands in our application for database schema changes
 
+#----------------------------------------------------------------------------#
+# Metrics.
+#----------------------------------------------------------------------------#
+
+metrics = Metrics()
+
+@app.before_request
+def start_request_metrics():
+  g.request_started = time.perf_counter()
+  g.sql_statements, g.sql_ms, g.template_ms = 0, 0.0, 0.0   # added up by record_query_time() and record_template_time()
+
+@app.teardown_request
+def record_request_metrics(error):
+  # where a route spends its time: all of it, in SQL and in Jinja, per endpoint
+  if 'request_started' not in g:
+    return
+  route = 'route.' + (request.endpoint or 'none')
+  metrics.timing(route + '.ms', (time.perf_counter() - g.request_started) * 1000)
+  metrics.timing(route + '.sql_ms', g.sql_ms)
+  metrics.timing(route + '.template_ms', g.template_ms)
+  metrics.increment(route + '.sql_statements', g.sql_statements)
+
+@before_render_template.connect_via(app)
+def start_template_timer(sender, template, context, **extra):
+  g.setdefault('templates_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def record_template_time(sender, template, context, **extra):
+  started = g.templates_started.pop()
+  elapsed_ms = (time.perf_counter() - started) * 1000
+  metrics.timing('template.' + (template.name or 'string'), elapsed_ms)
+  traced('render ' + (template.name or 'string'), started)
+  if 'template_ms' in g:
+    g.template_ms += elapsed_ms
+
+#----------------------------------------------------------------------------#
+# Logging.
+#----------------------------------------------------------------------------#
+
+# app.logger and the request log go through a bounded queue to a listener thread writing JSON lines to LOG_FILE,
+# so a slow disk or a burst of errors never holds up a request; what doesn't fit is dropped and counted
+log_handler, log_listener = start_pipeline(app.config['LOG_FILE'], app.config['LOG_MAX_BYTES'], app.config['LOG_BACKUPS'],
+                                           app.config['LOG_QUEUE_SIZE'], app.config['LOG_BLOCK_SECONDS'],
+                                           on_drop=lambda record: metrics.increment('logging.dropped'))
+atexit.register(log_listener.stop)     # flushes what is still queued
+
+def add_request_id(record):
+  # logging filter, runs in the request thread: every line logged during a request carries its id
+  record.request_id = g.get('request_id') if has_request_context() else None
+  return True
+
+log_handler.addFilter(add_request_id)
+app.logger.setLevel(logging.INFO)
+app.logger.addHandler(log_handler)
+request_log = logging.getLogger('fyyur.requests')
+request_log.setLevel(logging.INFO)
+request_log.addHandler(log_handler)
+request_log.propagate = False
+
+@app.before_request
+def assign_request_id():
+  # a proxy's X-Request-Id is kept so the lines match its logs
+  g.request_id = request.headers.get('X-Request-Id', '')[:64] or uuid.uuid4().hex
+
+@app.after_request
+def log_request(response):
+  response.headers['X-Request-Id'] = g.request_id
+  g.response_status = response.status_code      # for the request span
+  request_log.info('%s %s %s', request.method, request.path, response.status_code, extra={
+    'trace_id': g.trace.trace_id if g.get('trace') else None, 'route': request.endpoint, 'method': request.method, 'path': request.path, 'status': response.status_code,
+    'latency_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+    'sql_statements': g.sql_statements, 'sql_ms': round(g.sql_ms, 2), 'template_ms': round(g.template_ms, 2)})
+  return response
+
+#----------------------------------------------------------------------------#
+# Tracing.
+#----------------------------------------------------------------------------#
+
+# a span per sampled request with child spans for its SQL statements, template renders and cache lookups, exported
+# in batches to TRACE_FILE. Unsampled requests cost the sampling decision only
+tracer = Tracer(BatchExporter(app.config['TRACE_FILE'], app.config['TRACE_BATCH_SIZE'], app.config['TRACE_EXPORT_SECONDS']),
+                app.config['TRACE_SAMPLE_RATE'], app.config['TRACE_MAX_SPANS'])
+atexit.register(tracer.exporter.flush)
+
+@app.before_request
+def start_trace():
+  # an incoming traceparent header continues the caller's trace (and follows its sampling decision)
+  g.trace = tracer.start(request.headers.get('traceparent'))
+
+@app.after_request
+def add_traceparent(response):
+  # the traced request's context goes back as a traceparent header, so the caller (a browser, a proxy, load_test.py)
+  # can find its trace in TRACE_FILE and parent what it does next under the request span
+  if g.get('trace'):
+    response.headers['traceparent'] = g.trace.traceparent()
+  return response
+
+@app.teardown_request
+def finish_trace(error):
+  trace = g.pop('trace', None)
+  if trace:
+    tracer.finish(trace, request.method + ' ' + (request.url_rule.rule if request.url_rule else request.path),
+                  {'http.route': request.endpoint or '', 'http.status_code': g.get('response_status', 500)})
+
+def traced(name, started, **attributes):
+  # child span of the request's trace, from a time.perf_counter() reading to now; nothing when not sampled
+  trace = g.get('trace') if has_request_context() else None
+  if trace:
+    trace.add(name, started, time.perf_counter(), attributes)
+
+#----------------------------------------------------------------------------#
+# Slow queries.
+#----------------------------------------------------------------------------#
+
+def explain_analyze(statement, parameters):
+  # plan of a slow SELECT, run again on a connection of its own from the SlowQueryLog thread. Raw DBAPI cursor, so
+  # it goes around the hooks below. SlowQueryLog.explainable() only passes statements without locking clauses or
+  # writing functions, and the transaction is READ ONLY on top of that, rolled back and bounded by statement_timeout
+  connection = db.engine.raw_connection()
+  try:
+    cursor = connection.cursor()
+    cursor.execute('SET TRANSACTION READ ONLY')
+    cursor.execute('SET LOCAL statement_timeout = %s', (app.config['SLOW_QUERY_EXPLAIN_TIMEOUT_MS'],))
+    cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + statement, parameters)
+    return '\n'.join(row[0] for row in cursor.fetchall())
+  finally:
+    connection.rollback()
+    connection.close()
+
+# the slow query lines are JSON already, written as they are by a listener thread of their own, as for LOG_FILE
+slow_query_handler, slow_query_listener = start_pipeline(
+  app.config['SLOW_QUERY_LOG'], app.config['SLOW_QUERY_LOG_MAX_BYTES'], app.config['SLOW_QUERY_LOG_BACKUPS'],
+  app.config['LOG_QUEUE_SIZE'], app.config['LOG_BLOCK_SECONDS'], on_drop=lambda record: metrics.increment('logging.dropped'),
+  formatter=logging.Formatter('%(message)s'))
+atexit.register(slow_query_listener.stop)
+slow_query_log = SlowQueryLog(slow_query_handler, app.config['SLOW_QUERY_THRESHOLD_MS'], explain_analyze,
+                              app.config['SLOW_QUERY_EXPLAIN_SAMPLE'])
+
+@event.listens_for(db.engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+  conn.info['query_started'] = time.perf_counter()
+
+@event.listens_for(db.engine, 'after_cursor_execute')
+def record_query_time(conn, cursor, statement, parameters, context, executemany):
+  started = conn.info.pop('query_started')
+  duration_ms = (time.perf_counter() - started) * 1000
+  in_request = has_request_context()
+  if in_request and 'sql_ms' in g:
+    g.sql_statements += 1
+    g.sql_ms += duration_ms
+    traced('sql', started, **{'db.system': 'postgresql', 'db.statement': statement})
+  slow_query_log.record(statement, parameters, duration_ms, request.endpoint if in_request else None)
+
+#----------------------------------------------------------------------------#
+# Request profiler.
+#----------------------------------------------------------------------------#
+
+request_profiler = RequestProfiler(app.config['PROFILE_DIR'], app.config['PROFILE_KEEP'])
+# X-Profile header values, see `flask profile-token`. Without a key only the admin page can start profiles
+profile_tokens = URLSafeTimedSerializer(app.config['PROFILE_SIGNING_KEY'], salt='fyyur-profile') if app.config['PROFILE_SIGNING_KEY'] else None
+
+def profile_requested():
+  token = request.headers.get('X-Profile')
+  if token and profile_tokens:
+    try:
+      profile_tokens.loads(token, max_age=app.config['PROFILE_TOKEN_SECONDS'])
+      return True
+    except BadSignature:    # expired tokens too
+      return False
+  return not request.path.startswith(('/admin/', '/static/')) and request_profiler.take()
+
+@app.before_request
+def start_profile():
+  # the rest of the request, the view function included, runs under cProfile when asked for
+  if profile_requested():
+    g.profile_started = time.perf_counter()
+    g.profile = request_profiler.start()
+
+@app.teardown_request
+def save_profile(error):
+  profile = g.pop('profile', None)
+  if profile:
+    request_profiler.save(profile, request.endpoint, (time.perf_counter() - g.profile_started) * 1000)
+
+#----------------------------------------------------------------------------#
+# Memory profiler.
+#----------------------------------------------------------------------------#
+
+# opt-in: MEMORY_PROFILE_SAMPLE_RATE or the admin page. tracemalloc only runs while requests are being measured
+memory_profiler = MemoryProfiler(app.config['MEMORY_PROFILE_SAMPLE_RATE'], app.config['MEMORY_PROFILE_FRAMES'])
+
+@app.before_request
+def start_memory_profile():
+  if not request.path.startswith(('/admin/', '/static/')) and memory_profiler.take():
+    g.memory_profile = memory_profiler.start()
+
+@app.teardown_request
+def save_memory_profile(error):
+  started = g.pop('memory_profile', None)   # None too when another request of this worker was being measured
+  if started:
+    memory_profiler.finish(started, request.endpoint)
+
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+LIVE_ROWS = text('deleted_at IS NULL')           # partial index predicate: reads only ever look at live rows
+TOMBSTONED_ROWS = text('deleted_at IS NOT NULL')  # and the purge job at the tombstoned ones
+
 class Venue(db.Model):          # columns referred from /show_venue/<venue-id> route
     __tablename__ = 'venues'
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable = False)   # not null added as it is mandatorily required
-    genres = db.Column(db.ARRAY(db.String)) # array of string for genres
+    genres = db.Column(ARRAY(db.String)) # array of string for genres, postgres ARRAY for the && and @> operators
     address = db.Column(db.String(120))
     city = db.Column(db.String(120), nullable = False)  # not null added as it is mandatorily required
     state = db.Column(db.String(120), nullable = False) # not null added as it is mandatorily required
@@ -51,7 +277,21 @@ class Venue(db.Model):          # columns referred from /show_venue/<venue-id> r
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_talent_description = db.Column(db.String(200), default='')
     posting_date_venue = db.Column(db.DateTime, default = datetime.utcnow)
-    shows_venues = db.relationship('Show', backref='venue', cascade='all, delete, delete-orphan', lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # maintained by the shows counter trigger, see show_counter_state
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    deleted_at = db.Column(db.DateTime)    # tombstone set by delete_venue, the row is removed later by `flask purge-deleted`
+    version = db.Column(db.Integer, nullable=False, server_default='1')  # bumped by every edit, see update_entity()
+    # generated by postgres from name, city, state and genres, GIN indexed; deferred so pages never load it
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(
+      "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+      "setweight(to_tsvector('english', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || "
+      "setweight(to_tsvector('english', fyyur_array_text(genres)), 'B')", persisted=True)))
+    shows_venues = db.relationship('Show', backref='venue', cascade='all, delete, delete-orphan', passive_deletes=True, lazy=True)   # passive: the ON DELETE CASCADE foreign key removes the shows, nothing is loaded
+    __table_args__ = tuple([db.Index('ix_venues_search_vector', 'search_vector', postgresql_using='gin', postgresql_where=LIVE_ROWS),
+                            db.Index('ix_venues_genres', 'genres', postgresql_using='gin', postgresql_where=LIVE_ROWS),
+                            db.Index('ix_venues_state_city_name', 'state', 'city', 'name', 'id', postgresql_where=LIVE_ROWS),  # a city's venues by name, see available_venues()
+                            db.Index('ix_venues_tombstoned', 'id', postgresql_where=TOMBSTONED_ROWS)])
+    __mapper_args__ = {'version_id_col': version}   # ORM updates add AND version = :version and set version + 1
 
     def __repr__(self):
         return f'<{self.id} , {self.name}>'
@@ -63,7 +303,7 @@ class Artist(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable = False) # not null added as it is mandatorily required
-    genres = db.Column(db.ARRAY(db.String())) # array of string for genres
+    genres = db.Column(ARRAY(db.String())) # array of string for genres, postgres ARRAY for the && and @> operators
     city = db.Column(db.String(120), nullable = False)  # not null added as it is mandatorily required
     state = db.Column(db.String(120), nullable = False) # not null added as it is mandatorily required
     phone = db.Column(db.String(120))
@@ -77,7 +317,22 @@ class Artist(db.Model):
 #    songs = db.Column(db.String)      # getting list of songs as a string
     albumsL = db.Column(db.ARRAY(db.String()))   # album as array of string
     songsL = db.Column(db.ARRAY(db.String()))   # songs as array of string
-    shows_artists = db.relationship('Show', backref='artist', cascade='all, delete, delete-orphan', lazy=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # maintained by the shows counter trigger, see show_counter_state
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    deleted_at = db.Column(db.DateTime)    # tombstone set by delete_artist, the row is removed later by `flask purge-deleted`
+    version = db.Column(db.Integer, nullable=False, server_default='1')  # bumped by every edit, see update_entity()
+    # generated by postgres from name, city, state, genres, albums and songs, GIN indexed; deferred so pages never load it
+    search_vector = db.deferred(db.Column(TSVECTOR, db.Computed(
+      "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+      "setweight(to_tsvector('english', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || "
+      "setweight(to_tsvector('english', fyyur_array_text(genres)), 'B') || "
+      "setweight(to_tsvector('english', fyyur_array_text(\"albumsL\") || ' ' || fyyur_array_text(\"songsL\")), 'C')", persisted=True)))
+    shows_artists = db.relationship('Show', backref='artist', cascade='all, delete, delete-orphan', passive_deletes=True, lazy=True)   # passive: the ON DELETE CASCADE foreign key removes the shows, nothing is loaded
+    __table_args__ = tuple([db.Index('ix_artists_search_vector', 'search_vector', postgresql_using='gin', postgresql_where=LIVE_ROWS),
+                            db.Index('ix_artists_genres', 'genres', postgresql_using='gin', postgresql_where=LIVE_ROWS),
+                            db.Index('ix_artists_state_city', 'state', 'city', postgresql_where=LIVE_ROWS),
+                            db.Index('ix_artists_tombstoned', 'id', postgresql_where=TOMBSTONED_ROWS)])
+    __mapper_args__ = {'version_id_col': version}   # ORM updates add AND version = :version and set version + 1
 
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
@@ -89,8 +344,74 @@ class Show(db.Model):       # Instead of association_table, since Show is an ent
   id = db.Column(db.Integer, primary_key=True)
   artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=False)
   venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False)
-  start_time = db.Column(db.DateTime, default = datetime.utcnow, nullable=False)
-  __table_args__ = tuple([db.UniqueConstraint('artist_id', 'venue_id', 'start_time', name='_artist_venue_starttime_uc')]) # Unique constraint if someone tries to add same artist_id, venue_id and start_time
+  start_time = db.Column(db.DateTime, default = datetime.utcnow, nullable=False, primary_key=True)    # in the key: shows is partitioned by it
+  end_time = db.Column(db.DateTime, nullable=False)
+  deleted_at = db.Column(db.DateTime)    # tombstone, the row is removed later by `flask purge-deleted`
+  idempotency_key = db.Column(db.String(64))    # Idempotency-Key header or form token of the post that listed the show, see insert_show()
+  # One partition per month of start_time (shows_2026_11, ...) plus shows_default, see `flask create-show-partitions`.
+  # Unique indexes of a partitioned table must contain start_time, and postgres has no exclusion constraints on it:
+  # every partition has its own shows_<month>_venue_no_overlap / _artist_no_overlap (int4range of the id WITH =,
+  # tsrange WITH &&, the GiST indexes make the check a lookup) and the shows_boundary_overlap trigger checks the
+  # shows that reach into the next month, which shows_at_most_a_day keeps to the first day of it
+  __table_args__ = tuple([db.UniqueConstraint('artist_id', 'venue_id', 'start_time', name='_artist_venue_starttime_uc'), # Unique constraint if someone tries to add same artist_id, venue_id and start_time
+                          db.Index('ix_shows_idempotency_key', 'idempotency_key', 'start_time', unique=True, postgresql_where=text('idempotency_key IS NOT NULL')),
+                          db.Index('ix_shows_start_time', 'start_time', postgresql_where=LIVE_ROWS),
+                          db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),    # not partial: the ON DELETE CASCADE lookups by venue_id use it too
+                          db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),  # same for artists, and their calendars
+                          db.Index('ix_shows_tombstoned', 'id', postgresql_where=TOMBSTONED_ROWS),
+                          db.CheckConstraint('end_time > start_time', name='shows_end_after_start'),
+                          db.CheckConstraint("end_time <= start_time + interval '1 day'", name='shows_at_most_a_day'),
+                          {'postgresql_partition_by': 'RANGE (start_time)'}])
+
+class ArchivedShow(db.Model):   # shows older than SHOWS_ARCHIVE_YEARS, moved out of shows by `flask archive-shows`
+  __tablename__ = 'shows_archive'
+
+  id = db.Column(db.Integer, primary_key=True, autoincrement=False)   # id the show had in shows
+  artist_id = db.Column(db.Integer, db.ForeignKey('artists.id', ondelete='CASCADE'), nullable=False)
+  venue_id = db.Column(db.Integer, db.ForeignKey('venues.id', ondelete='CASCADE'), nullable=False)
+  start_time = db.Column(db.DateTime, nullable=False)
+  end_time = db.Column(db.DateTime, nullable=False)
+  __table_args__ = tuple([db.Index('ix_shows_archive_venue_id_start_time', 'venue_id', 'start_time'),
+                          db.Index('ix_shows_archive_artist_id_start_time', 'artist_id', 'start_time')])
+
+class Genre(db.Model):      # reference table for genres, ids are forms.genre_ids
+  __tablename__ = 'genres'
+
+  id = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+  name = db.Column(db.String(50), nullable=False, unique=True)
+
+class ShowCounterState(db.Model):   # single row. Shows starting after rolled_until are counted as upcoming, the rest as past
+  __tablename__ = 'show_counter_state'
+
+  id = db.Column(db.Integer, primary_key=True)
+  rolled_until = db.Column(db.DateTime, nullable=False)
+
+def filter_for_browse(query, model, genres=None, match_all=False, city=None, state=None):
+  # filters of the /venues and /artists listings and of the searches. Genres go through the GIN indexed genres array:
+  # @> (contains) when all of them must match, && (overlap) when any of them may
+  if genres:
+    query = query.filter(model.genres.contains(genres) if match_all else model.genres.overlap(genres))
+  if city:
+    query = query.filter(model.city == city)
+  if state:
+    query = query.filter(model.state == state)
+  return query
+
+def id_range(column):
+  # one-value int4range of an id column, the form in which the show exclusion constraints (and their GiST indexes) hold it
+  return func.int4range(column, column, literal_column("'[]'"))
+
+def show_span():
+  return func.tsrange(Show.start_time, Show.end_time)
+
+def browse_filters():
+  # ?genre=Jazz&genre=Folk&match=all&city=&state= of the listing pages, as keyword arguments for filter_for_browse()
+  return {
+    'genres': request.args.getlist('genre'),
+    'match_all': request.args.get('match') == 'all',
+    'city': request.args.get('city', '').strip(),
+    'state': request.args.get('state', '').strip()
+  }
 
 #----------------------------------------------------------------------------#
 # Filters.
@@ -106,13 +427,97 @@ def format_datetime(value, format='medium'):
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+#----------------------------------------------------------------------------#
+# Autocomplete index.
+#----------------------------------------------------------------------------#
+
+autocomplete_index = PrefixIndex()   # venue and artist names for /api/v1/autocomplete
+
+def autocomplete_names():
+  # built on first use, then kept current by the create/delete controllers of this worker. Rebuilt every
+  # AUTOCOMPLETE_REFRESH_SECONDS so that writes made through other workers show up as well
+  built_at = autocomplete_index.built_at
+  if built_at is None or time.monotonic() - built_at > app.config['AUTOCOMPLETE_REFRESH_SECONDS']:
+    names = [('venues', venue.id, venue.name) for venue in db.session.query(Venue.id, Venue.name).filter(Venue.deleted_at.is_(None))]
+    names += [('artists', artist.id, artist.name) for artist in db.session.query(Artist.id, Artist.name).filter(Artist.deleted_at.is_(None))]
+    autocomplete_index.rebuild(names)
+  return autocomplete_index
+
+#----------------------------------------------------------------------------#
+# Cache invalidation.
+#----------------------------------------------------------------------------#
+
+invalidation_hooks = {}     # column -> [hook(kind, entity_id, changed)] run after an edit changed that column
+
+def invalidates_on(*columns):
+  # registers a hook for the cached data built from these venue/artist columns
+  def register(hook):
+    for column in columns:
+      invalidation_hooks.setdefault(column, []).append(hook)
+    return hook
+  return register
+
+def invalidate_cached(kind, entity_id, changed):
+  # changed: {column: new value} of the edit; each hook runs once, and only if one of its columns changed
+  hooks = []
+  for column in changed:
+    for hook in invalidation_hooks.get(column, []):
+      if hook not in hooks:
+        hooks.append(hook)
+  for hook in hooks:
+    hook(kind, entity_id, changed)
+
+@invalidates_on('name')
+def reindex_autocomplete_name(kind, entity_id, changed):
+  autocomplete_index.add(kind, entity_id, changed['name'])
+
+#----------------------------------------------------------------------------#
+# Calendar cache.
+#----------------------------------------------------------------------------#
+
+calendar_cache = {}     # (kind, entity id, 'YYYY-MM') -> (time.monotonic() when built, shows per day), oldest first
+calendar_lock = threading.Lock()
+
+def cached_calendar(kind, entity_id, month, build):
+  # month grids of this worker, dropped by the show writes below and after CALENDAR_CACHE_SECONDS for the
+  # writes made through other workers
+  key = (kind, entity_id, month)
+  started = time.perf_counter()
+  with calendar_lock:
+    cached = calendar_cache.get(key)
+  hit = cached is not None and time.monotonic() - cached[0] < app.config['CALENDAR_CACHE_SECONDS']
+  traced('cache calendar', started, **{'cache.hit': hit})
+  if hit:
+    return cached[1]
+  days = build()
+  with calendar_lock:
+    calendar_cache.pop(key, None)
+    while len(calendar_cache) >= app.config['CALENDAR_CACHE_SIZE']:
+      del calendar_cache[next(iter(calendar_cache))]
+    calendar_cache[key] = (time.monotonic(), days)
+  return days
+
+def invalidate_calendars(shows):
+  # shows: (venue_id, artist_id, start_time) of the shows just written; both sides show them on their month grid
+  with calendar_lock:
+    for venue_id, artist_id, start_time in shows:
+      month = start_time.strftime('%Y-%m')
+      calendar_cache.pop(('venues', venue_id, month), None)
+      calendar_cache.pop(('artists', artist_id, month), None)
+
+@invalidates_on('name', 'deleted_at')
+def clear_calendars(kind, entity_id, changed):
+  # a renamed or deleted venue is on the grids of all its artists, and the other way round
+  with calendar_lock:
+    calendar_cache.clear()
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
 def index():
-  recent_venues = Venue.query.order_by(desc(Venue.posting_date_venue)).limit(10).all()
+  recent_venues = Venue.query.filter(Venue.deleted_at.is_(None)).order_by(desc(Venue.posting_date_venue)).limit(10).all()
   latest_posted_venues = []
   for venue in recent_venues:
     latest_posted_venues.append({
@@ -121,7 +526,7 @@ def index():
       'venue_posting_date': venue.posting_date_venue
     })
 
-  recent_artists = Artist.query.order_by(desc(Artist.posting_date_artist)).limit(10).all()
+  recent_artists = Artist.query.filter(Artist.deleted_at.is_(None)).order_by(desc(Artist.posting_date_artist)).limit(10).all()
   latest_posted_artists = []
   for artist in recent_artists:
     latest_posted_artists.append({
@@ -139,24 +544,35 @@ def index():
 def venues():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
-  areas = db.session.query(func.count(Venue.id), Venue.city, Venue.state).group_by(Venue.city, Venue.state).all() # SQL equivalent: select count(id), city, state from venues group by city, state;
+  # num_shows is read from the denormalized upcoming_shows_count, so one query over venues builds every area (shows is not touched)
+  filters = browse_filters()
+  all_venues = filter_for_browse(db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.upcoming_shows_count).filter(Venue.deleted_at.is_(None)), Venue, **filters).order_by(Venue.state, Venue.city, Venue.id).all()
   data = []
-  for area in areas:
-    area_venue = Venue.query.filter_by(city=area.city, state=area.state).all()    # filter by city and state from each area
-    venue_data = []  # data of venues in each area
-    for venuelist in area_venue:
-      venue_data.append({
-        'id': venuelist.id,
-        'name': venuelist.name,
-        'num_shows': db.session.query(Show).filter(Show.venue_id==venuelist.id).filter(Show.start_time>datetime.now()).count()  # count total number of shows 'upcoming'
+  for venuelist in all_venues:
+    if not data or data[-1]['city'] != venuelist.city or data[-1]['state'] != venuelist.state:   # rows are sorted by area, so a new city/state starts a new area
+      data.append({
+        'city': venuelist.city,
+        'state': venuelist.state,
+        'venues': []   # in venues.html the parameter name expected in return is 'venues'
       })
-    data.append({
-      'city': area.city,
-      'state': area.state,
-      'venues': venue_data   # in venues.html the parameter name expected in return is 'venues'
+    data[-1]['venues'].append({
+      'id': venuelist.id,
+      'name': venuelist.name,
+      'num_shows': venuelist.upcoming_shows_count  # total number of shows 'upcoming'
     })
 
-  return render_template('pages/venues.html', areas=data);
+  return render_template('pages/venues.html', areas=data, filters=filters, genres_choices=genres_choices);
+
+def search_by_text(model, search_term, genres=None, match_all=False):
+  # ranked full text search over the GIN indexed search_vector, so "jazz san francisco" matches on genre and city.
+  # When the term has no searchable words (stop words, single letters like "A") or matches nothing, fall back
+  # to the partial, case-insensitive name match. genres optionally narrows the results, see filter_for_browse()
+  query = filter_for_browse(model.query.filter(model.deleted_at.is_(None)), model, genres, match_all)
+  tsquery = func.websearch_to_tsquery('english', search_term)
+  results = query.filter(model.search_vector.op('@@')(tsquery)).order_by(desc(func.ts_rank(model.search_vector, tsquery)), model.id).all()
+  if not results:
+    results = query.filter(model.name.ilike(f'%{search_term}%')).all()    # ilike -> ignorecase; f' -> Literal string interpolation
+  return results
 
 @app.route('/venues/search', methods=['POST', 'GET'])   # added GET otherwise "Method not allowed" error was coming
 def search_venues():
@@ -166,9 +582,9 @@ def search_venues():
 
   # target query -- select * from venues where lower(name) like lower('%hop%');
 
-  search_term = request.form.get('search_term', '')
+  search_term = request.values.get('search_term', '')   # form post from the navbar, or query string e.g. ?search_term=&genre=Jazz&genre=Blues&match=all
 #  iCaseSearch = Venue.query.filter(Venue.name.ilike('%' + search_term + '%')).all() OR newer better way to use f-strings as below
-  searching_venue = Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).all()    # ilike -> ignorecase; f' -> Literal string interpolation
+  searching_venue = search_by_text(Venue, search_term, request.values.getlist('genre'), request.values.get('match') == 'all')
   data = []
 
   if len(searching_venue) == 0:
@@ -182,7 +598,7 @@ def search_venues():
       data.append({
         'id': venues.id,
         'name': venues.name,
-        'num_shows': db.session.query(Show).filter(Show.venue_id == venues.id).filter(Show.start_time>datetime.now()).count()
+        'num_shows': venues.upcoming_shows_count
       })
       response={
         'count': len(searching_venue),  # total count.. we can use another db query Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).count() but it will mean 2 queries to db all() and count()
@@ -191,32 +607,63 @@ def search_venues():
 
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
+def past_shows_page(kind, entity_id, before=None, archive=False):
+  # one page of the past shows of a venue or artist (kind 'venue' / 'artist'), newest first, keyset paginated on
+  # start_time: before is the start time of the last show of the previous page. The hot shows come first; the
+  # archive is only read when the visitor asks for the shows older than those (archive=True), and only offered when
+  # it has some. Returns (shows, next page as url arguments or None)
+  per_page = app.config['PAST_SHOWS_PER_PAGE']
+  other_kind = 'artist' if kind == 'venue' else 'venue'
+  other = Artist if kind == 'venue' else Venue
+
+  def older_than(model, start_time, *columns):
+    # the past shows of the entity in model (Show or ArchivedShow) before start_time, with a live other side
+    return db.session.query(*columns).join(other, other.id == getattr(model, other_kind + '_id')) \
+      .filter(getattr(model, kind + '_id') == entity_id, other.deleted_at.is_(None), model.start_time < start_time)
+
+  model = ArchivedShow if archive else Show
+  query = older_than(model, before or datetime.now(), model.start_time, other.id, other.name, other.image_link)
+  if not archive:
+    query = query.filter(Show.deleted_at.is_(None))
+  rows = query.order_by(desc(model.start_time)).limit(per_page + 1).all()    # one more tells whether there is a next page
+
+  shows = [{other_kind + '_id': row.id, other_kind + '_name': row.name, other_kind + '_image_link': row.image_link,
+            'start_time': row.start_time.strftime('%Y-%m-%d %H:%M:%S')} for row in rows[:per_page]]
+  if len(rows) > per_page:
+    return shows, {'past_before': rows[per_page - 1].start_time.isoformat(), 'archive': int(archive)}
+  if not archive:     # hot shows exhausted: the next page is the archive, continuing from the last one shown
+    last = rows[-1].start_time if rows else before or datetime.now()
+    if db.session.query(older_than(ArchivedShow, last, ArchivedShow.id).exists()).scalar():
+      return shows, {'past_before': last.isoformat(), 'archive': 1}
+  return shows, None
+
+def past_shows_arguments():
+  # ?past_before=&archive= of the detail pages, see past_shows_page()
+  try:
+    before = dateutil.parser.parse(request.args['past_before']) if request.args.get('past_before') else None
+  except (ValueError, OverflowError):
+    abort(400)
+  return before, request.args.get('archive', 0, type=int) == 1
+
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  get_venue = Venue.query.get(venue_id)
+  get_venue = Venue.query.filter_by(id=venue_id, deleted_at=None).first()
   
   if not get_venue:
     return render_template('errors/404.html')
 
-  past_shows_details = db.session.query(Show).join(Artist).filter(Show.venue_id == get_venue.id).filter(Show.start_time<datetime.now()) # past shows
-  past_shows = []
-  for p_shows in past_shows_details:
-    past_shows.append({
-      'artist_id': p_shows.artist_id,
-      'artist_name': p_shows.artist.name,
-      'artist_image_link': p_shows.artist.image_link,
-      'start_time': p_shows.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-  upcoming_shows_details =  db.session.query(Show).join(Artist).filter(Show.venue_id == get_venue.id).filter(Show.start_time>datetime.now()) # future shows
+  past_shows, past_shows_next = past_shows_page('venue', get_venue.id, *past_shows_arguments())    # one page, see past_shows_page()
+  # future shows, with the artist columns from the join instead of a lazy load of each show's artist
+  upcoming_shows_details =  db.session.query(Show.artist_id, Show.start_time, Artist.name, Artist.image_link).join(Artist).filter(Show.venue_id == get_venue.id, Show.deleted_at.is_(None), Artist.deleted_at.is_(None)).filter(Show.start_time>datetime.now())
   upcoming_shows = []
   for u_shows in upcoming_shows_details:
     upcoming_shows.append({
       'artist_id': u_shows.artist_id,
-      'artist_name': u_shows.artist.name,
-      'artist_image_link': u_shows.artist.image_link,
+      'artist_name': u_shows.name,
+      'artist_image_link': u_shows.image_link,
       'start_time': u_shows.start_time.strftime('%Y-%m-%d %H:%M:%S')     
     })
   
@@ -234,7 +681,8 @@ def show_venue(venue_id):
     'image_link': get_venue.image_link,
     'upcoming_shows': upcoming_shows,
     'past_shows': past_shows,
-    'past_shows_count': len(past_shows),
+    'past_shows_next': url_for('show_venue', venue_id=get_venue.id, **past_shows_next) if past_shows_next else None,
+    'past_shows_count': get_venue.past_shows_count,     # archived shows included
     'upcoming_shows_count': len(upcoming_shows)
   }
 
@@ -272,14 +720,17 @@ def create_venue_submission():
       # addVenue DB Object
       addVenue = Venue(name=name, city=city, state=state, address=address, phone=phone, genres=genres, image_link=image_link,facebook_link=facebook_link, website=website, seeking_talent=seeking_talent, seeking_talent_description=seeking_talent_description, posting_date_venue=posting_date_venue)
       db.session.add(addVenue)
+      db.session.flush()    # assigns the id for the autocomplete index
+      new_venue_id = addVenue.id
       db.session.commit()
+      autocomplete_index.add('venues', new_venue_id, name)
 
 #      new_venue = db.session.query(Venue.id).filter_by(name=name).order_by(desc(Venue.posting_date_venue)).first()
 
     except:
       error=True
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('%s could not be listed', name)
       
     finally:
       db.session.close()
@@ -303,34 +754,46 @@ def create_venue_submission():
 #  return redirect(url_for('venues'))
   return redirect(url_for('index'))
 
-@app.route('/venues/<int:venue_id>', methods=['DELETE'])
-def delete_venue(venue_id):
-  # TODO: Complete this endpoint for taking a venue_id, and using
-  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
-
+def delete_entity(model, kind, entity_id):
+  # soft delete: UPDATEs set the tombstone on the row and, in the same transaction, on its live shows, so the show
+  # counters drop (the trigger counts live rows only) and their slots are free again for the overlap checks and
+  # the *_no_overlap constraints. Reads skip tombstoned rows and `flask purge-deleted` removes them later in small batches
+  started = time.perf_counter()
   error = False
   try:
-    get_venue = Venue.query.get(venue_id)
-    db.session.delete(get_venue)
+    deleted_at = datetime.now()
+    deleted = model.query.filter_by(id=entity_id, deleted_at=None).update({'deleted_at': deleted_at}, synchronize_session=False)
+    if deleted:
+      db.session.execute(text(f'UPDATE shows SET deleted_at = :deleted_at WHERE {kind[:-1]}_id = :id AND deleted_at IS NULL'),
+                         {'deleted_at': deleted_at, 'id': entity_id})
     db.session.commit()
-  except:
+  except SQLAlchemyError:
     error = True
     db.session.rollback()
-    print(sys.exc_info())
+    app.logger.exception('%s %s could not be deleted', kind, entity_id)
   finally:
     db.session.close()
+  elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
 
-# if error: 
-#    flash(f'Venue ' + venue_id + ' could not be deleted.')
-#  else:
-#    flash(f'Venue ' + venue_id + ' was successfully deleted.')
-  
-  return jsonify({'success': True})
-  #return redirect(url_for('index'))
+  if error:
+    response, status = {'success': False, 'error': 'could not be deleted'}, 500
+  elif not deleted:
+    response, status = {'success': False, 'error': 'not found'}, 404
+  else:
+    autocomplete_index.remove(kind, entity_id)
+    invalidate_cached(kind, entity_id, {'deleted_at': deleted_at})
+    response, status = {'success': True}, 200
+  response.update({'id': entity_id, 'elapsed_ms': elapsed_ms})
+  return jsonify(response), status, {'Server-Timing': f'db;dur={elapsed_ms}'}
+
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
+def delete_venue(venue_id):
+  # TODO: Complete this endpoint for taking a venue_id, and using
+  # SQLAlchemy ORM to delete a record. Handle cases where the session commit could fail.
+  return delete_entity(Venue, 'venues', venue_id)
 
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
-  #return None
 
 
 #  Artists
@@ -339,8 +802,9 @@ def delete_venue(venue_id):
 def artists():
   # TODO: replace with real data returned from querying the database
 
-  data = Artist.query.all()   # get all artists in the table
-  return render_template('pages/artists.html', artists=data)
+  filters = browse_filters()
+  data = filter_for_browse(db.session.query(Artist.id, Artist.name).filter(Artist.deleted_at.is_(None)), Artist, **filters).order_by(Artist.id).all()   # get all artists in the table, only the columns the page shows
+  return render_template('pages/artists.html', artists=data, filters=filters, genres_choices=genres_choices)
 
 @app.route('/artists/search', methods=['POST', 'GET'])
 def search_artists():
@@ -348,8 +812,8 @@ def search_artists():
   # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
   # search for "band" should return "The Wild Sax Band".
 
-  search_term = request.form.get('search_term', '')
-  searching_artist = Artist.query.filter(Artist.name.ilike(f'%{search_term}%')).all()    # ilike -> ignorecase; f' -> Literal string interpolation
+  search_term = request.values.get('search_term', '')   # form post from the navbar, or query string e.g. ?search_term=&genre=Jazz&genre=Blues&match=all
+  searching_artist = search_by_text(Artist, search_term, request.values.getlist('genre'), request.values.get('match') == 'all')
   data = []
 
   if len(searching_artist) == 0:    # if not matching string or other characters, it will reeturn Number = 0 and no data instead of error earlier
@@ -363,7 +827,7 @@ def search_artists():
       data.append({
         'id': artists.id,
         'name': artists.name,
-        'num_shows': db.session.query(Show).filter(Show.artist_id == artists.id).filter(Show.start_time>datetime.now()).count()
+        'num_shows': artists.upcoming_shows_count
       })
       response={
         'count': len(searching_artist),  # total count.. we can use another db query Venue.query.filter(Venue.name.ilike(f'%{search_term}%')).count() but it will mean 2 queries to db all() and count()
@@ -372,32 +836,29 @@ def search_artists():
 
   return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
+def delete_artist(artist_id):
+  return delete_entity(Artist, 'artists', artist_id)
+
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
   # shows the venue page with the given venue_id
   # TODO: replace with real venue data from the venues table, using venue_id
 
-  get_artist = Artist.query.get(artist_id)
+  get_artist = Artist.query.filter_by(id=artist_id, deleted_at=None).first()
   
   if not get_artist:
     return render_template('errors/404.html')
 
-  past_shows_details = db.session.query(Show).join(Venue).filter(Show.artist_id == get_artist.id).filter(Show.start_time<datetime.now()) # past shows
-  past_shows = []
-  for p_shows in past_shows_details:
-    past_shows.append({
-      'venue_id': p_shows.venue_id,
-      'venue_name': p_shows.venue.name,
-      'venue_image_link': p_shows.venue.image_link,
-      'start_time': p_shows.start_time.strftime('%Y-%m-%d %H:%M:%S')
-    })
-  upcoming_shows_details =  db.session.query(Show).join(Venue).filter(Show.artist_id == get_artist.id).filter(Show.start_time>datetime.now()) # future shows
+  past_shows, past_shows_next = past_shows_page('artist', get_artist.id, *past_shows_arguments())    # one page, see past_shows_page()
+  # future shows, with the venue columns from the join instead of a lazy load of each show's venue
+  upcoming_shows_details =  db.session.query(Show.venue_id, Show.start_time, Venue.name, Venue.image_link).join(Venue).filter(Show.artist_id == get_artist.id, Show.deleted_at.is_(None), Venue.deleted_at.is_(None)).filter(Show.start_time>datetime.now())
   upcoming_shows = []
   for u_shows in upcoming_shows_details:
     upcoming_shows.append({
       'venue_id': u_shows.venue_id,
-      'venue_name': u_shows.venue.name,
-      'venue_image_link': u_shows.venue.image_link,
+      'venue_name': u_shows.name,
+      'venue_image_link': u_shows.image_link,
       'start_time': u_shows.start_time.strftime('%Y-%m-%d %H:%M:%S')     
     })
   
@@ -417,7 +878,8 @@ def show_artist(artist_id):
     'image_link': get_artist.image_link,
     'upcoming_shows': upcoming_shows,
     'past_shows': past_shows,
-    'past_shows_count': len(past_shows),
+    'past_shows_next': url_for('show_artist', artist_id=get_artist.id, **past_shows_next) if past_shows_next else None,
+    'past_shows_count': get_artist.past_shows_count,    # archived shows included
     'upcoming_shows_count': len(upcoming_shows)
   }
 #  return str(get_artist.genres)
@@ -425,57 +887,128 @@ def show_artist(artist_id):
 
 #  Update
 #  ----------------------------------------------------------------
+
+def update_entity(model, kind, entity_id, version, values):
+  # optimistic locking: the edit form carries the version it was rendered from. Only the columns whose value differs
+  # are written, in a single UPDATE ... WHERE id = :id AND version = :version that also bumps the version (version_id_col),
+  # so an edit saved in between makes it match no row and is reported as a conflict instead of being overwritten.
+  # Returns (outcome, changed) with outcome one of 'updated', 'unchanged', 'conflict', 'not found', 'error'
+  changed = {}
+  try:
+    entity = model.query.filter_by(id=entity_id, deleted_at=None).first()
+    if entity is None:
+      return 'not found', changed
+    if entity.version != version:
+      return 'conflict', changed
+    changed = {column: value for column, value in values.items() if getattr(entity, column) != value}
+    if not changed:
+      return 'unchanged', changed
+    for column, value in changed.items():
+      setattr(entity, column, value)
+    db.session.commit()
+  except StaleDataError:
+    db.session.rollback()
+    return 'conflict', {}
+  except SQLAlchemyError:
+    db.session.rollback()
+    app.logger.exception('%s %s could not be updated', kind, entity_id)
+    return 'error', {}
+  finally:
+    db.session.close()
+  invalidate_cached(kind, entity_id, changed)
+  return 'updated', changed
+
+def edit_outcome(outcome, label, name, template, **context):
+  # flashes the outcome of update_entity(); conflicts and errors render the submitted form again so nothing typed is lost
+  if outcome in ('updated', 'unchanged'):
+    flash(label + ' ' + name + (' was successfully updated!' if outcome == 'updated' else ' was not changed.'))
+    return None
+  if outcome == 'not found':
+    return render_template('errors/404.html'), 404
+  if outcome == 'conflict':
+    flash(label + ' ' + name + ' was changed by someone else in the meantime. Reload the page to edit the current version.')
+    return render_template(template, **context), 409
+  flash(label + ' ' + name + ' could\'nt be updated!')
+  return render_template(template, **context), 500
+
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
-  form = ArtistForm()
-  artist={
-    "id": 4,
-    "name": "Guns N Petals",
-    "genres": ["Rock n Roll"],
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "326-123-5000",
-    "website": "https://www.gunsnpetalsband.com",
-    "facebook_link": "https://www.facebook.com/GunsNPetals",
-    "seeking_venue": True,
-    "seeking_description": "Looking for shows to perform at in the San Francisco Bay Area!",
-    "image_link": "https://images.unsplash.com/photo-1549213783-8284d0336c4f?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=300&q=80"
-  }
-  # TODO: populate form with fields from artist with ID <artist_id>
-  return render_template('forms/edit_artist.html', form=form, artist=artist)
+  # one projected query for the form fields, search_vector and the counters are never loaded
+  artist = db.session.query(Artist.id, Artist.name, Artist.genres, Artist.city, Artist.state, Artist.phone, Artist.website,
+                            Artist.facebook_link, Artist.image_link, Artist.albumsL, Artist.songsL, Artist.seeking_venue,
+                            Artist.seeking_venue_description, Artist.version).filter(Artist.id == artist_id, Artist.deleted_at.is_(None)).first()
+  if not artist:
+    return render_template('errors/404.html'), 404
+
+  data = artist._asdict()
+  data['albums'] = ', '.join(artist.albumsL or [])
+  data['songs'] = ', '.join(artist.songsL or [])
+  form = EditArtistForm(data=data)
+  return render_template('forms/edit_artist.html', form=form, artist=data)
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-  # TODO: take values from the form submitted, and update existing
-  # artist record with ID <artist_id> using the new attributes
-
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  form = EditArtistForm()
+  artist = {'id': artist_id, 'name': form.name.data}
+  if not form.validate_on_submit():
+    flash('Artist ' + form.name.data + ' failed due to validation error!')
+    return render_template('forms/edit_artist.html', form=form, artist=artist), 400
+
+  values = {
+    'name': form.name.data,
+    'city': form.city.data,
+    'state': form.state.data,
+    'phone': form.phone.data,
+    'genres': form.genres.data,
+    'image_link': form.image_link.data,
+    'facebook_link': form.facebook_link.data,
+    'website': form.website.data,
+    'albumsL': [x.strip() for x in form.albums.data.split(',')],    # convert to array of strings, as on create
+    'songsL': [y.strip() for y in form.songs.data.split(',')],
+    'seeking_venue': form.seeking_venue.data,
+    'seeking_venue_description': form.seeking_venue_description.data
+  }
+  outcome, changed = update_entity(Artist, 'artists', artist_id, form.version.data, values)
+  response = edit_outcome(outcome, 'Artist', form.name.data, 'forms/edit_artist.html', form=form, artist=artist)
+  return response or redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
-  form = VenueForm()
-  venue={
-    "id": 1,
-    "name": "The Musical Hop",
-    "genres": ["Jazz", "Reggae", "Swing", "Classical", "Folk"],
-    "address": "1015 Folsom Street",
-    "city": "San Francisco",
-    "state": "CA",
-    "phone": "123-123-1234",
-    "website": "https://www.themusicalhop.com",
-    "facebook_link": "https://www.facebook.com/TheMusicalHop",
-    "seeking_talent": True,
-    "seeking_description": "We are on the lookout for a local artist to play every two weeks. Please call us.",
-    "image_link": "https://images.unsplash.com/photo-1543900694-133f37abaaa5?ixlib=rb-1.2.1&ixid=eyJhcHBfaWQiOjEyMDd9&auto=format&fit=crop&w=400&q=60"
-  }
-  # TODO: populate form with values from venue with ID <venue_id>
-  return render_template('forms/edit_venue.html', form=form, venue=venue)
+  # one projected query for the form fields, search_vector and the counters are never loaded
+  venue = db.session.query(Venue.id, Venue.name, Venue.genres, Venue.address, Venue.city, Venue.state, Venue.phone, Venue.website,
+                           Venue.facebook_link, Venue.image_link, Venue.seeking_talent, Venue.seeking_talent_description,
+                           Venue.version).filter(Venue.id == venue_id, Venue.deleted_at.is_(None)).first()
+  if not venue:
+    return render_template('errors/404.html'), 404
+
+  data = venue._asdict()
+  form = EditVenueForm(data=data)
+  return render_template('forms/edit_venue.html', form=form, venue=data)
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-  # TODO: take values from the form submitted, and update existing
-  # venue record with ID <venue_id> using the new attributes
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  form = EditVenueForm()
+  venue = {'id': venue_id, 'name': form.name.data}
+  if not form.validate_on_submit():
+    flash('Venue ' + form.name.data + ' failed due to validation error!')
+    return render_template('forms/edit_venue.html', form=form, venue=venue), 400
+
+  values = {
+    'name': form.name.data,
+    'city': form.city.data,
+    'state': form.state.data,
+    'address': form.address.data,
+    'phone': form.phone.data,
+    'genres': form.genres.data,
+    'image_link': form.image_link.data,
+    'facebook_link': form.facebook_link.data,
+    'website': form.website.data,
+    'seeking_talent': form.seeking_talent.data,
+    'seeking_talent_description': form.seeking_talent_description.data
+  }
+  outcome, changed = update_entity(Venue, 'venues', venue_id, form.version.data, values)
+  response = edit_outcome(outcome, 'Venue', form.name.data, 'forms/edit_venue.html', form=form, venue=venue)
+  return response or redirect(url_for('show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
@@ -513,12 +1046,15 @@ def create_artist_submission():
       # addArtist DB Object
       addArtist = Artist(name=name, city=city, state=state, phone=phone, genres=genres, image_link=image_link,facebook_link=facebook_link, website=website, albumsL=albumsL, songsL=songsL ,seeking_venue=seeking_venue, seeking_venue_description=seeking_venue_description, posting_date_artist=posting_date_artist)
       db.session.add(addArtist)
+      db.session.flush()    # assigns the id for the autocomplete index
+      new_artist_id = addArtist.id
       db.session.commit()
+      autocomplete_index.add('artists', new_artist_id, name)
 
     except:
       error=True
       db.session.rollback()
-      print(sys.exc_info())
+      app.logger.exception('%s could not be listed', name)
       
     finally:
       db.session.close()
@@ -547,17 +1083,20 @@ def shows():
   # TODO: replace with real venues data.
   #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-  shows_artist_venue = db.session.query(Show).join(Artist).join(Venue).all()
+  # the columns the page shows in one query, no lazy load of each show's venue and artist
+  shows_artist_venue = db.session.query(Show.venue_id, Venue.name.label('venue_name'), Show.artist_id, Artist.name.label('artist_name'),
+                                        Artist.image_link.label('artist_image_link'), Show.start_time) \
+    .join(Artist).join(Venue).filter(Show.deleted_at.is_(None), Artist.deleted_at.is_(None), Venue.deleted_at.is_(None)).all()
 #  didn't worked -> shows_artist_venue = db.session.query(Show.venue_id, Venue.name, Show.artist_id, Artist.name, Artist.image_link, Show.start_time.strftime('%Y-%m-%d %H:%M:%S')).join(Artist).join(Venue).all()
   # target --- select * from shows join artists on shows.artist_id = artists.id join venues on shows.venue_id = venues.id
   data = []
   for show in shows_artist_venue:
     data.append({
       'venue_id': show.venue_id,
-      'venue_name': show.venue.name,
+      'venue_name': show.venue_name,
       'artist_id': show.artist_id,
-      'artist_name': show.artist.name,
-      'artist_image_link': show.artist.image_link,
+      'artist_name': show.artist_name,
+      'artist_image_link': show.artist_image_link,
       'start_time': show.start_time.strftime('%Y-%m-%d %H:%M:%S')
     })
 
@@ -569,41 +1108,452 @@ def create_shows():
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
+EXISTING_SHOW = """
+  SELECT id, false AS created FROM shows
+  WHERE deleted_at IS NULL AND (idempotency_key = :idempotency_key
+                                OR (artist_id = :artist_id AND venue_id = :venue_id AND start_time = :start_time))
+  LIMIT 1"""
+
+# One statement for the whole create: the INSERT skips tombstoned artists/venues and ON CONFLICT DO NOTHING absorbs
+# a repeated idempotency key or the same artist, venue and start time, in which case the second branch returns the
+# show that is already there (it only runs when nothing was inserted). Without a conflict target DO NOTHING covers the
+# overlap exclusion constraints of the month's partition as well, see show_conflicts(); an overlap with a show of the
+# neighbouring month raises from the shows_boundary_overlap trigger instead. The unique index on the idempotency key
+# is per start time (shows is partitioned by it), so a key already used for another start time is checked here.
+# Unknown artist/venue ids fail on the foreign keys.
+INSERT_SHOW = f"""
+  WITH inserted AS (
+    INSERT INTO shows (artist_id, venue_id, start_time, end_time, idempotency_key)
+    SELECT :artist_id, :venue_id, :start_time, :end_time, :idempotency_key
+    WHERE NOT EXISTS (SELECT 1 FROM artists WHERE id = :artist_id AND deleted_at IS NOT NULL)
+      AND NOT EXISTS (SELECT 1 FROM venues WHERE id = :venue_id AND deleted_at IS NOT NULL)
+      AND NOT EXISTS (SELECT 1 FROM shows WHERE idempotency_key = :idempotency_key AND deleted_at IS NULL)
+    ON CONFLICT DO NOTHING
+    RETURNING id)
+  SELECT id, true AS created FROM inserted
+  UNION ALL
+  ({EXISTING_SHOW})
+  LIMIT 1"""
+
+FOREIGN_KEY_VIOLATION = '23503'
+EXCLUSION_VIOLATION = '23P01'     # shows_boundary_overlap, see Show
+
+OVERLAPPING_SHOWS = """
+  SELECT s.start_time, s.end_time, s.venue_id = :venue_id AS same_venue, v.name AS venue_name, a.name AS artist_name
+  FROM shows s JOIN venues v ON v.id = s.venue_id JOIN artists a ON a.id = s.artist_id
+  WHERE s.deleted_at IS NULL AND tsrange(s.start_time, s.end_time) && tsrange(:start_time, :end_time)
+    AND s.start_time > CAST(:start_time AS timestamp) - interval '1 day' AND s.start_time < :end_time  -- prunes to 1-2 months
+    AND (int4range(s.venue_id, s.venue_id, '[]') = int4range(:venue_id, :venue_id, '[]')     -- the expressions of
+         OR int4range(s.artist_id, s.artist_id, '[]') = int4range(:artist_id, :artist_id, '[]'))  -- the constraint indexes
+  ORDER BY s.start_time"""
+
+def insert_show(artist_id, venue_id, start_time, end_time, idempotency_key=None):
+  # returns (show id, created). (None, False) when nothing was listed: the artist or venue is deleted or the show
+  # overlaps another one, see show_conflicts(). Raises IntegrityError for unknown ids
+  params = {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time, 'end_time': end_time,
+            'idempotency_key': idempotency_key}
+  try:
+    row = db.session.execute(text(INSERT_SHOW), params).first()
+  except IntegrityError as error:
+    if getattr(error.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+      raise
+    db.session.rollback()
+    return None, False
+  if row is None:
+    # a concurrent post with the same key committed after this statement took its snapshot: the conflict was
+    # detected but its row is only visible to a new statement
+    row = db.session.execute(text(EXISTING_SHOW), params).first()
+  db.session.commit()
+  if row and row.created:
+    invalidate_calendars([(venue_id, artist_id, start_time)])
+  return (row.id, row.created) if row else (None, False)
+
+def show_conflicts(artist_id, venue_id, start_time, end_time):
+  # why insert_show() listed nothing, as messages for the start_time field. Only runs on that path
+  if Artist.query.filter(Artist.id == artist_id, Artist.deleted_at.isnot(None)).count():
+    return ['Artist ' + str(artist_id) + ' was deleted.']
+  if Venue.query.filter(Venue.id == venue_id, Venue.deleted_at.isnot(None)).count():
+    return ['Venue ' + str(venue_id) + ' was deleted.']
+  params = {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time, 'end_time': end_time}
+  return [overlap_message(show) for show in db.session.execute(text(OVERLAPPING_SHOWS), params)]
+
+def overlap_message(show):
+  # show: row with start_time, end_time, same_venue, venue_name and artist_name of the show in the way
+  return (('Venue ' + show.venue_name if show.same_venue else 'Artist ' + show.artist_name) + ' already has a show from '
+          + show.start_time.strftime('%Y-%m-%d %H:%M') + ' to ' + show.end_time.strftime('%Y-%m-%d %H:%M') + '.')
+
+#  Show series
+#  ----------------------------------------------------------------
+
+RECURRENCE_FREQUENCIES = {'DAILY': DAILY, 'WEEKLY': WEEKLY, 'MONTHLY': MONTHLY}    # ShowForm.repeat choices
+
+LIVE_ENTITIES = """
+  SELECT (SELECT deleted_at IS NULL FROM artists WHERE id = :artist_id) AS artist,
+         (SELECT deleted_at IS NULL FROM venues WHERE id = :venue_id) AS venue"""
+
+SERIES_OCCURRENCES = """unnest(CAST(:start_times AS timestamp[]), CAST(:end_times AS timestamp[]), CAST(:idempotency_keys AS varchar[]))
+       AS o(start_time, end_time, idempotency_key)"""
+
+# The whole series in one multi-row INSERT: the occurrences travel as three parallel arrays and are unnested by
+# postgres, so it is one statement whatever the number of shows. ON CONFLICT DO NOTHING skips the occurrences that
+# hit the unique constraint, a known idempotency key or an overlap within a month; SERIES_CONFLICTS then tells which
+# one. An overlap across a month boundary fails the statement, see insert_show_series()
+INSERT_SHOW_SERIES = f"""
+  INSERT INTO shows (artist_id, venue_id, start_time, end_time, idempotency_key)
+  SELECT :artist_id, :venue_id, o.start_time, o.end_time, o.idempotency_key
+  FROM {SERIES_OCCURRENCES}
+  ON CONFLICT DO NOTHING
+  RETURNING id, start_time"""
+
+SERIES_CONFLICTS = f"""
+  SELECT o.start_time AS occurrence, s.id, s.start_time, s.end_time, s.venue_id = :venue_id AS same_venue,
+         v.name AS venue_name, a.name AS artist_name,
+         s.idempotency_key = o.idempotency_key
+           OR (s.artist_id = :artist_id AND s.venue_id = :venue_id AND s.start_time = o.start_time) AS same_show
+  FROM {SERIES_OCCURRENCES}
+  JOIN shows s ON s.deleted_at IS NULL
+              AND (s.idempotency_key = o.idempotency_key
+                   OR (tsrange(s.start_time, s.end_time) && tsrange(o.start_time, o.end_time)
+                       AND s.start_time > o.start_time - interval '1 day' AND s.start_time < o.end_time
+                       AND (int4range(s.venue_id, s.venue_id, '[]') = int4range(:venue_id, :venue_id, '[]')
+                            OR int4range(s.artist_id, s.artist_id, '[]') = int4range(:artist_id, :artist_id, '[]'))))
+  JOIN venues v ON v.id = s.venue_id JOIN artists a ON a.id = s.artist_id
+  ORDER BY o.start_time, s.start_time"""
+
+def expand_recurrence(start_time, rule):
+  # start times of a series. rule: an RRULE string ("FREQ=WEEKLY;BYDAY=TU;COUNT=26") or a dateutil rrule. Raises
+  # ValueError for a bad rule or more than SHOW_SERIES_MAX_OCCURRENCES shows (a rule without COUNT or UNTIL never ends)
+  if isinstance(rule, str):
+    try:
+      rule = rrulestr(rule, dtstart=start_time)
+    except (ValueError, TypeError):
+      raise ValueError('invalid rule ' + rule)
+  limit = app.config['SHOW_SERIES_MAX_OCCURRENCES']
+  start_times = list(itertools.islice(rule, limit + 1))
+  if not start_times:
+    raise ValueError('the series has no shows')
+  if len(start_times) > limit:
+    raise ValueError('the series has more than ' + str(limit) + ' shows')
+  return start_times
+
+def series_arrays(occurrences):
+  return {'start_times': [o['start_time'] for o in occurrences], 'end_times': [o['end_time'] for o in occurrences],
+          'idempotency_keys': [o['idempotency_key'] for o in occurrences]}
+
+def insert_show_series(artist_id, venue_id, start_times, duration, idempotency_key=None, skip_conflicts=True):
+  # lists a series in one transaction and reports every occurrence: status 'created', 'existing' (same slot or same
+  # idempotency key, e.g. a retry) or 'conflict' (overlaps another show, with the messages). Returns (committed,
+  # occurrences); with skip_conflicts=False any conflict rolls the whole series back and 'created' becomes 'free'.
+  # Raises LookupError when the artist or the venue doesn't exist or was deleted
+  live = db.session.execute(text(LIVE_ENTITIES), {'artist_id': artist_id, 'venue_id': venue_id}).first()
+  for kind, entity_id, is_live in (('Artist', artist_id, live.artist), ('Venue', venue_id, live.venue)):
+    if not is_live:     # None: no such id, False: tombstoned
+      raise LookupError(kind + ' ' + str(entity_id) + (' does not exist' if is_live is None else ' was deleted'))
+
+  key = idempotency_key[:56] if idempotency_key else None    # occurrence n gets "key:n", within the 64 characters
+  occurrences = [{'start_time': start_time, 'end_time': start_time + duration,
+                  'idempotency_key': key + ':' + str(n) if key else None} for n, start_time in enumerate(start_times)]
+  params = {'artist_id': artist_id, 'venue_id': venue_id}
+  insertable = occurrences
+  try:
+    with db.session.begin_nested():
+      rows = db.session.execute(text(INSERT_SHOW_SERIES), dict(params, **series_arrays(insertable))).fetchall()
+  except IntegrityError as error:
+    if getattr(error.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+      raise
+    # the shows_boundary_overlap trigger: leave out every occurrence with a show in the way and insert the rest
+    blocked = {show.occurrence for show in db.session.execute(text(SERIES_CONFLICTS), dict(params, **series_arrays(occurrences)))}
+    insertable = [o for o in occurrences if o['start_time'] not in blocked]
+    rows = db.session.execute(text(INSERT_SHOW_SERIES), dict(params, **series_arrays(insertable))).fetchall() if insertable else []
+  inserted = {row.start_time: row.id for row in rows}
+
+  skipped = [o for o in occurrences if o['start_time'] not in inserted]
+  in_the_way = {}
+  if skipped:
+    for show in db.session.execute(text(SERIES_CONFLICTS), dict(params, **series_arrays(skipped))):
+      in_the_way.setdefault(show.occurrence, []).append(show)
+  for occurrence in occurrences:
+    del occurrence['idempotency_key']
+    if occurrence['start_time'] in inserted:
+      occurrence.update(status='created', show_id=inserted[occurrence['start_time']])
+      continue
+    shows = in_the_way.get(occurrence['start_time'], [])
+    same = [show for show in shows if show.same_show]
+    if same:
+      occurrence.update(status='existing', show_id=same[0].id)
+    else:
+      occurrence.update(status='conflict', conflicts=[overlap_message(show) for show in shows] or ['Overlaps another show.'])
+
+  if not skip_conflicts and any(o['status'] == 'conflict' for o in occurrences):
+    db.session.rollback()
+    for occurrence in occurrences:
+      if occurrence['status'] == 'created':     # rolled back: free, but not listed
+        del occurrence['show_id']
+        occurrence['status'] = 'free'
+    return False, occurrences
+  db.session.commit()
+  invalidate_calendars([(venue_id, artist_id, start_time) for start_time in inserted])
+  return True, occurrences
+
 @app.route('/shows/create', methods=['POST'])
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
-  # TODO: insert form data as a new Show record in the db, instead
+  form = ShowForm()
+  if not form.validate_on_submit():
+    flash('Show failed due to validation error!')
+    return redirect(url_for('index'))
+
+  idempotency_key = request.headers.get('Idempotency-Key', form.idempotency_key.data)[:64] or None
+  if form.repeat.data:
+    return create_show_series_submission(form, idempotency_key)
+  end_time = form.start_time.data + timedelta(minutes=form.duration.data)
+  try:
+    show_id, created = insert_show(form.artist_id.data, form.venue_id.data, form.start_time.data, end_time, idempotency_key)
+    if show_id is None:
+      form.start_time.errors = show_conflicts(form.artist_id.data, form.venue_id.data, form.start_time.data, end_time) or \
+                               ['Show overlaps another show, try again.']   # the other show was deleted meanwhile
+  except IntegrityError as error:
+    db.session.rollback()
+    if getattr(error.orig, 'pgcode', None) != FOREIGN_KEY_VIOLATION:
+      raise
+    # the constraint name tells which id is unknown (shows_artist_id_fkey / shows_venue_id_fkey)
+    unknown = 'Artist ' + str(form.artist_id.data) if 'artist_id' in str(error.orig.diag.constraint_name) else 'Venue ' + str(form.venue_id.data)
+    flash('Show could\'nt be listed: ' + unknown + ' does not exist!')
+    return redirect(url_for('index'))
+  except SQLAlchemyError:
+    db.session.rollback()
+    app.logger.exception('show could not be listed')
+    flash('Show could\'nt be listed!')
+    return redirect(url_for('index'))
+  finally:
+    db.session.close()
+
+  # on successful db insert, flash success else unsuccessful
+  if show_id is None:
+    flash('Show could\'nt be listed!')
+    return render_template('forms/new_show.html', form=form), 409
+  if created:
+    flash('Show was successfully listed!')
+  else:
+    flash('Show was already listed!')     # retry or double submit: the first post listed it
+  return redirect(url_for('index'))
 
-  error=False
+def create_show_series_submission(form, idempotency_key):
+  # the repeat option of the show form: the occurrences that are free get listed, the others are flashed
+  if bool(form.repeat_count.data) == bool(form.repeat_until.data):
+    form.repeat.errors = ['Give either a number of shows or an end date.']
+    return render_template('forms/new_show.html', form=form), 400
+  until = datetime.combine(form.repeat_until.data, datetime.max.time()) if form.repeat_until.data else None
   try:
-    artist_id = request.form['artist_id']           
-    venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
-    # addArtist DB Object
-    addShow = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
-    db.session.add(addShow)
-    db.session.commit()
+    start_times = expand_recurrence(form.start_time.data, rrule(RECURRENCE_FREQUENCIES[form.repeat.data], dtstart=form.start_time.data,
+                                                                count=form.repeat_count.data, until=until))
+  except ValueError as error:
+    form.repeat.errors = ['The series could\'nt be expanded: ' + str(error) + '.']
+    return render_template('forms/new_show.html', form=form), 400
 
-  except:
-    error=True
+  try:
+    committed, occurrences = insert_show_series(form.artist_id.data, form.venue_id.data, start_times,
+                                                timedelta(minutes=form.duration.data), idempotency_key)
+  except LookupError as error:
+    db.session.rollback()
+    flash('Shows could\'nt be listed: ' + str(error) + '!')
+    return redirect(url_for('index'))
+  except SQLAlchemyError:
     db.session.rollback()
-    print(sys.exc_info())
-    
+    app.logger.exception('show series could not be listed')
+    flash('Shows could\'nt be listed!')
+    return redirect(url_for('index'))
   finally:
     db.session.close()
 
-    # on successful db insert, flash success else unsuccessful
-  if error:
-    flash('Show could\'nt be listed!')
+  statuses = [occurrence['status'] for occurrence in occurrences]
+  flash(str(statuses.count('created')) + ' of ' + str(len(occurrences)) + ' shows were successfully listed'
+        + (', ' + str(statuses.count('existing')) + ' were already listed' if 'existing' in statuses else '') + '!')
+  for occurrence in occurrences:
+    if occurrence['status'] == 'conflict':
+      flash('Show on ' + occurrence['start_time'].strftime('%Y-%m-%d %H:%M') + ' was not listed: ' + ' '.join(occurrence['conflicts']))
+  return redirect(url_for('index'))
+
+
+#  Calendars
+#  ----------------------------------------------------------------
+
+def calendar_days(kind, entity_id, first_day, next_month):
+  # {date: [{'id', 'name', 'start_time', 'end_time'} of the other side, by start time]} for one month of a venue or an
+  # artist: one query grouped by day over a range scan of ix_shows_venue_id_start_time / ix_shows_artist_id_start_time
+  own, other = (Show.venue_id, Artist) if kind == 'venues' else (Show.artist_id, Venue)
+  day = func.date_trunc('day', Show.start_time)
+  shows = func.json_agg(aggregate_order_by(func.json_build_object('id', other.id, 'name', other.name, 'start_time', Show.start_time,
+                                                                  'end_time', Show.end_time), Show.start_time))
+  rows = db.session.query(day.label('day'), shows.label('shows')) \
+    .join(other, other.id == (Show.artist_id if kind == 'venues' else Show.venue_id)) \
+    .filter(own == entity_id, Show.start_time >= first_day, Show.start_time < next_month,
+            Show.deleted_at.is_(None), other.deleted_at.is_(None)) \
+    .group_by(day).order_by(day)
+  return {row.day.date(): row.shows for row in rows}
+
+def entity_calendar(model, kind, entity_id):
+  # ?month=2026-11, the current month by default
+  entity = db.session.query(model.id, model.name).filter(model.id == entity_id, model.deleted_at.is_(None)).first()
+  if not entity:
+    return render_template('errors/404.html'), 404
+  try:
+    first_day = datetime.strptime(request.args.get('month') or datetime.now().strftime('%Y-%m'), '%Y-%m')
+  except ValueError:
+    abort(400)
+  next_month = (first_day + timedelta(days=31)).replace(day=1)
+  days = cached_calendar(kind, entity_id, first_day.strftime('%Y-%m'), lambda: calendar_days(kind, entity_id, first_day, next_month))
+  return render_template('pages/calendar.html', kind=kind, entity=entity, month=first_day, days=days,
+                         weeks=calendar.Calendar().monthdatescalendar(first_day.year, first_day.month),
+                         previous_month=(first_day - timedelta(days=1)).strftime('%Y-%m'), next_month=next_month.strftime('%Y-%m'))
+
+@app.route('/venues/<int:venue_id>/calendar')
+def venue_calendar(venue_id):
+  return entity_calendar(Venue, 'venues', venue_id)
 
+@app.route('/artists/<int:artist_id>/calendar')
+def artist_calendar(artist_id):
+  return entity_calendar(Artist, 'artists', artist_id)
+
+
+#  API
+#  ----------------------------------------------------------------
+
+def available_venues(city, state, start, end):
+  # live venues of a city with no live show overlapping [start, end): an anti-join (NOT EXISTS) probing the GiST
+  # indexes of the <month>_venue_no_overlap constraints once per venue of the city, no schedule is loaded; the
+  # start_time bounds limit it to the partitions of the window. ix_venues_state_city_name returns the city's venues
+  # already ordered, so a LIMIT stops probing once it has enough free venues
+  busy = db.session.query(Show.id).filter(id_range(Show.venue_id) == id_range(Venue.id), Show.deleted_at.is_(None),
+                                          show_span().op('&&')(func.tsrange(start, end)),
+                                          Show.start_time > start - timedelta(days=1), Show.start_time < end)   # prunes the months
+  return db.session.query(Venue.id, Venue.name, Venue.address, Venue.city, Venue.state) \
+    .filter(Venue.deleted_at.is_(None), Venue.city == city, Venue.state == state, ~busy.exists()) \
+    .order_by(Venue.name, Venue.id)
+
+@app.route('/api/v1/venues/available')
+def venues_available():
+  # ?city=Austin&state=TX&start=2026-11-06T20:00&end=2026-11-06T23:00[&limit=]
+  city, state = request.args.get('city', '').strip(), request.args.get('state', '').strip()
+  try:
+    start, end = dateutil.parser.parse(request.args['start']), dateutil.parser.parse(request.args['end'])
+  except (KeyError, ValueError, OverflowError):
+    return jsonify({'error': 'start and end must be date times'}), 400
+  if not city or not state:
+    return jsonify({'error': 'city and state are required'}), 400
+  if end <= start:
+    return jsonify({'error': 'end must be after start'}), 400
+
+  limit = request.args.get('limit', 50, type=int)
+  if limit < 1:
+    return jsonify({'error': 'limit must be at least 1'}), 400
+  limit = min(limit, 200)
+  venues = available_venues(city, state, start, end).limit(limit).all()
+  return jsonify({'city': city, 'state': state, 'start': start.isoformat(), 'end': end.isoformat(),
+                  'venues': [venue._asdict() for venue in venues]})
+
+@app.route('/api/v1/shows/series', methods=['POST'])
+def create_show_series():
+  # {"artist_id": 1, "venue_id": 2, "start_time": "2026-11-03T20:00", "duration": 120,
+  #  "rrule": "FREQ=WEEKLY;BYDAY=TU;UNTIL=20270430", "skip_conflicts": true} with an optional Idempotency-Key header
+  payload = request.get_json(silent=True) or {}
+  try:
+    artist_id, venue_id = int(payload['artist_id']), int(payload['venue_id'])
+    start_time = dateutil.parser.parse(payload['start_time'])
+    duration = timedelta(minutes=int(payload.get('duration', 120)))
+    start_times = expand_recurrence(start_time, payload['rrule'])
+  except KeyError as error:
+    return jsonify({'error': str(error) + ' is required'}), 400
+  except (TypeError, ValueError, OverflowError) as error:
+    return jsonify({'error': str(error)}), 400
+  if not timedelta(0) < duration <= timedelta(days=1):
+    return jsonify({'error': 'duration must be between 1 and 1440 minutes'}), 400
+
+  try:
+    committed, occurrences = insert_show_series(artist_id, venue_id, start_times, duration, request.headers.get('Idempotency-Key'),
+                                                skip_conflicts=payload.get('skip_conflicts', True))
+  except LookupError as error:
+    db.session.rollback()
+    return jsonify({'error': str(error)}), 404
+  except SQLAlchemyError:
+    db.session.rollback()
+    app.logger.exception('show series could not be listed')
+    return jsonify({'error': 'could not be listed'}), 500
+  finally:
+    db.session.close()
+
+  statuses = [occurrence['status'] for occurrence in occurrences]
+  for occurrence in occurrences:
+    occurrence.update(start_time=occurrence['start_time'].isoformat(), end_time=occurrence['end_time'].isoformat())
+  if not committed or ('conflict' in statuses and 'created' not in statuses):
+    status = 409
   else:
-    flash('Show was successfully listed!')
-    # TODO: on unsuccessful db insert, flash an error instead.
-  
-  return redirect(url_for('index'))
-#  return render_template('pages/home.html')
+    status = 201 if 'created' in statuses else 200
+  return jsonify({'committed': committed, 'created': statuses.count('created'), 'occurrences': occurrences}), status
+
+@app.route('/api/v1/autocomplete')
+def autocomplete():
+  # top venue and artist names starting with q (at any word), served from memory: no database query per keystroke
+  limit = min(request.args.get('limit', app.config['AUTOCOMPLETE_LIMIT'], type=int), 50)
+  started = time.perf_counter()
+  results = autocomplete_names().search(request.args.get('q', ''), limit)
+  traced('cache autocomplete', started)
+  return jsonify({'venues': results.get('venues', []), 'artists': results.get('artists', [])})
 
 
+#  Admin
+#  ----------------------------------------------------------------
+
+def local_only(view):
+  # admin pages answer to requests from this machine only (e.g. through an ssh tunnel), everyone else gets a 404
+  @functools.wraps(view)
+  def local_view(*args, **kwargs):
+    if request.remote_addr not in ('127.0.0.1', '::1'):
+      abort(404)
+    return view(*args, **kwargs)
+  return local_view
+
+@app.route('/admin/slow-queries')
+@local_only
+def slow_queries():
+  # statements over SLOW_QUERY_THRESHOLD_MS since this worker started, by total time, with the sampled plans
+  return render_template('pages/slow_queries.html', queries=slow_query_log.top(), threshold_ms=slow_query_log.threshold_ms)
+
+@app.route('/admin/metrics')
+@local_only
+def metrics_page():
+  # timings of this worker since it started: routes (total, SQL and template time) and templates
+  return render_template('pages/metrics.html', timings=metrics.timings(), counters=metrics.counters())
+
+@app.route('/admin/profiles', methods=['GET', 'POST'])
+@local_only
+def profiles():
+  # recent request profiles of all workers (they share PROFILE_DIR); the form arms this worker for the next requests
+  form = ProfileRequestsForm()
+  if form.validate_on_submit():
+    request_profiler.arm(form.requests.data)
+    flash(str(form.requests.data) + ' next requests will be profiled.' if form.requests.data else 'Profiling stopped.')
+    return redirect(url_for('profiles'))
+  return render_template('pages/profiles.html', form=form, profiles=request_profiler.profiles(), armed=request_profiler.armed)
+
+@app.route('/admin/memory', methods=['GET', 'POST'])
+@local_only
+def memory():
+  # peak and retained allocation per endpoint of this worker's measured requests, and the sites that kept the most
+  form = ProfileRequestsForm()
+  if form.validate_on_submit():
+    memory_profiler.arm(form.requests.data)
+    flash(str(form.requests.data) + ' next requests will be measured.' if form.requests.data else 'Memory profiling stopped.')
+    return redirect(url_for('memory'))
+  return render_template('pages/memory.html', form=form, routes=memory_profiler.routes(), sites=memory_profiler.top_sites(),
+                         armed=memory_profiler.armed, sample_rate=memory_profiler.sample_rate)
+
+@app.route('/admin/profiles/<name>.<any(pstats, collapsed):kind>')
+@local_only
+def profile_file(name, kind):
+  # python -m pstats <file> / flamegraph.pl <file> > flame.svg
+  return send_from_directory(request_profiler.directory, name + '.' + kind, as_attachment=True)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -613,15 +1563,260 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+# Shows that feed upcoming_shows_count / past_shows_count. Insert/delete/update triggers on shows keep the
+# counters in step; the commands below move shows across rolled_until and repair drift. Archived shows stay counted
+# (archive_shows() adds them back), they are all past so rolling never needs them.
+COUNTED_SHOWS = 'SELECT venue_id, artist_id, start_time FROM shows WHERE deleted_at IS NULL'
+COUNTED_ARCHIVED_SHOWS = 'SELECT venue_id, artist_id, start_time FROM shows_archive'
+
+def roll_show_counters(now=None):
+  # move shows that started since the last run from upcoming to past. FOR UPDATE on the state row makes the
+  # shows triggers (which read it FOR SHARE) wait, so no show is counted against a stale rolled_until
+  now = now or datetime.now()
+  rolled_until = db.session.execute(text('SELECT rolled_until FROM show_counter_state FOR UPDATE')).scalar()
+  moved = 0
+  if now > rolled_until:
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+      result = db.session.execute(text(f"""
+        UPDATE {table} SET upcoming_shows_count = {table}.upcoming_shows_count - started.n,
+                           past_shows_count = {table}.past_shows_count + started.n
+        FROM (SELECT {column} AS id, count(*) AS n FROM ({COUNTED_SHOWS}) counted
+              WHERE start_time > :rolled_until AND start_time <= :now GROUP BY {column}) started
+        WHERE {table}.id = started.id"""), {'rolled_until': rolled_until, 'now': now})
+      moved += result.rowcount
+    db.session.execute(text('UPDATE show_counter_state SET rolled_until = :now'), {'now': now})
+  db.session.commit()
+  return moved
+
+def check_show_counters(repair=False):
+  # compare the stored counters with a full recount and optionally overwrite the ones that drifted
+  rolled_until = db.session.execute(text('SELECT rolled_until FROM show_counter_state FOR UPDATE')).scalar()
+  drift = []
+  for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+    recount = f"""
+      SELECT e.id, e.upcoming_shows_count, e.past_shows_count,
+             coalesce(c.upcoming, 0) AS upcoming, coalesce(c.past, 0) AS past
+      FROM {table} e LEFT JOIN (
+        SELECT {column} AS id, count(*) FILTER (WHERE start_time > :rolled_until) AS upcoming,
+               count(*) FILTER (WHERE start_time <= :rolled_until) AS past
+        FROM ({COUNTED_SHOWS} UNION ALL {COUNTED_ARCHIVED_SHOWS}) counted GROUP BY {column}) c ON c.id = e.id
+      WHERE e.upcoming_shows_count <> coalesce(c.upcoming, 0) OR e.past_shows_count <> coalesce(c.past, 0)"""
+    rows = db.session.execute(text(recount), {'rolled_until': rolled_until}).fetchall()
+    drift.extend((table, row) for row in rows)
+    if repair and rows:
+      db.session.execute(text(f"""
+        UPDATE {table} SET upcoming_shows_count = fixed.upcoming, past_shows_count = fixed.past
+        FROM ({recount}) fixed WHERE {table}.id = fixed.id"""), {'rolled_until': rolled_until})
+  db.session.commit()
+  return drift
+
+# archived shows of the tombstoned venues (or artists), taken off the counters of both sides as they go: they stay
+# counted until the purge (see COUNTED_ARCHIVED_SHOWS), and the ON DELETE CASCADE of shows_archive runs no trigger
+PURGE_ARCHIVED_SHOWS = """
+  WITH purged AS (
+    DELETE FROM shows_archive WHERE id IN (
+      SELECT s.id FROM {table} e JOIN shows_archive s ON s.{column} = e.id WHERE e.deleted_at IS NOT NULL LIMIT :batch_size)
+    RETURNING venue_id, artist_id, start_time),
+  venue_counts AS (
+    UPDATE venues e SET upcoming_shows_count = e.upcoming_shows_count - c.upcoming, past_shows_count = e.past_shows_count - c.past
+    FROM (SELECT venue_id AS id, count(*) FILTER (WHERE start_time > :rolled_until) AS upcoming,
+                 count(*) FILTER (WHERE start_time <= :rolled_until) AS past FROM purged GROUP BY venue_id) c
+    WHERE e.id = c.id),
+  artist_counts AS (
+    UPDATE artists e SET upcoming_shows_count = e.upcoming_shows_count - c.upcoming, past_shows_count = e.past_shows_count - c.past
+    FROM (SELECT artist_id AS id, count(*) FILTER (WHERE start_time > :rolled_until) AS upcoming,
+                 count(*) FILTER (WHERE start_time <= :rolled_until) AS past FROM purged GROUP BY artist_id) c
+    WHERE e.id = c.id)
+  SELECT count(*) FROM purged"""
+
+def purge_deleted(batch_size=500, rows_per_second=2000):
+  # remove tombstoned shows, venues and artists. Every batch is its own short transaction, so the locks on shows
+  # are brief, and the loop sleeps to stay under rows_per_second. Shows and archived shows go first so the ON DELETE
+  # CASCADE of the final venue/artist DELETE finds nothing left to do
+  batches = [
+    ('shows', """DELETE FROM shows WHERE id IN (
+        SELECT id FROM shows WHERE deleted_at IS NOT NULL LIMIT :batch_size)"""),
+    ('shows', """DELETE FROM shows WHERE id IN (
+        SELECT s.id FROM venues v JOIN shows s ON s.venue_id = v.id WHERE v.deleted_at IS NOT NULL LIMIT :batch_size)"""),
+    ('shows', """DELETE FROM shows WHERE id IN (
+        SELECT s.id FROM artists a JOIN shows s ON s.artist_id = a.id WHERE a.deleted_at IS NOT NULL LIMIT :batch_size)"""),
+    ('archived shows', PURGE_ARCHIVED_SHOWS.format(table='venues', column='venue_id')),
+    ('archived shows', PURGE_ARCHIVED_SHOWS.format(table='artists', column='artist_id')),
+    ('venues', """DELETE FROM venues WHERE id IN (
+        SELECT id FROM venues WHERE deleted_at IS NOT NULL LIMIT :batch_size)"""),
+    ('artists', """DELETE FROM artists WHERE id IN (
+        SELECT id FROM artists WHERE deleted_at IS NOT NULL LIMIT :batch_size)"""),
+  ]
+  purged = {'shows': 0, 'archived shows': 0, 'venues': 0, 'artists': 0}
+  for table, statement in batches:
+    while True:
+      started = time.perf_counter()
+      if table == 'archived shows':   # rolled_until FOR UPDATE as in archive_shows(), the counters move by it
+        rolled_until = db.session.execute(text('SELECT rolled_until FROM show_counter_state FOR UPDATE')).scalar()
+        deleted = db.session.execute(text(statement), {'batch_size': batch_size, 'rolled_until': rolled_until}).scalar()
+      else:
+        deleted = db.session.execute(text(statement), {'batch_size': batch_size}).rowcount
+      db.session.commit()
+      purged[table] += deleted
+      if deleted < batch_size:
+        break
+      time.sleep(max(0, deleted / rows_per_second - (time.perf_counter() - started)))
+  return purged
+
+def create_show_partitions(months_ahead=12, now=None):
+  # monthly partitions of shows from this month to months_ahead, see fyyur_create_show_partition() (migration
+  # c38e6a177920). Shows of a new month that were listed into shows_default move into its partition
+  first_day = (now or datetime.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+  created = []
+  for n in range(months_ahead + 1):
+    month = first_day + relativedelta(months=n)
+    if db.session.execute(text('SELECT fyyur_create_show_partition(:month)'), {'month': month}).scalar():
+      created.append('shows_' + month.strftime('%Y_%m'))
+    db.session.commit()     # one month per transaction: ATTACH locks shows
+  return created
+
+def show_partitions(before):
+  # attached monthly partitions whose whole month is before `before`, oldest first
+  partitions = db.session.execute(text("""
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'shows'::regclass AND c.relname ~ '^shows_[0-9]{4}_[0-9]{2}$'
+    ORDER BY c.relname""")).scalars()
+  return [name for name in partitions if datetime.strptime(name, 'shows_%Y_%m') + relativedelta(months=1) <= before]
+
+def detach_show_partitions(keep_months=24, now=None):
+  # detach the monthly partitions older than keep_months: they stay as standalone tables (shows_2024_01, ...) and
+  # leave every query on shows. DETACH fires no delete trigger, so their live shows come off the counters here,
+  # in the same transaction. The state row is locked first, as in roll_show_counters()
+  first_day = (now or datetime.now()).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+  detached = []
+  for partition in show_partitions(first_day - relativedelta(months=keep_months)):
+    rolled_until = db.session.execute(text('SELECT rolled_until FROM show_counter_state FOR UPDATE')).scalar()
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+      db.session.execute(text(f"""
+        UPDATE {table} SET upcoming_shows_count = {table}.upcoming_shows_count - leaving.upcoming,
+                           past_shows_count = {table}.past_shows_count - leaving.past
+        FROM (SELECT {column} AS id, count(*) FILTER (WHERE start_time > :rolled_until) AS upcoming,
+                     count(*) FILTER (WHERE start_time <= :rolled_until) AS past
+              FROM {partition} WHERE deleted_at IS NULL GROUP BY {column}) leaving
+        WHERE {table}.id = leaving.id"""), {'rolled_until': rolled_until})
+    db.session.execute(text(f'ALTER TABLE shows DETACH PARTITION {partition}'))
+    db.session.commit()
+    detached.append(partition)
+  return detached
+
+# One batch of the archive: the oldest live shows before the cutoff leave shows for shows_archive in a single
+# statement. The delete trigger takes them off the counters, the last two CTEs put them back on
+ARCHIVE_SHOWS = """
+  WITH moved AS (
+    DELETE FROM shows WHERE (id, start_time) IN (
+      SELECT id, start_time FROM shows WHERE deleted_at IS NULL AND start_time < :cutoff ORDER BY start_time LIMIT :batch_size)
+    RETURNING id, artist_id, venue_id, start_time, end_time),
+  archived AS (
+    INSERT INTO shows_archive (id, artist_id, venue_id, start_time, end_time)
+    SELECT id, artist_id, venue_id, start_time, end_time FROM moved
+    RETURNING venue_id, artist_id, start_time),
+  venue_counts AS (
+    UPDATE venues e SET upcoming_shows_count = e.upcoming_shows_count + c.upcoming, past_shows_count = e.past_shows_count + c.past
+    FROM (SELECT venue_id AS id, count(*) FILTER (WHERE start_time > :rolled_until) AS upcoming,
+                 count(*) FILTER (WHERE start_time <= :rolled_until) AS past FROM archived GROUP BY venue_id) c
+    WHERE e.id = c.id),
+  artist_counts AS (
+    UPDATE artists e SET upcoming_shows_count = e.upcoming_shows_count + c.upcoming, past_shows_count = e.past_shows_count + c.past
+    FROM (SELECT artist_id AS id, count(*) FILTER (WHERE start_time > :rolled_until) AS upcoming,
+                 count(*) FILTER (WHERE start_time <= :rolled_until) AS past FROM archived GROUP BY artist_id) c
+    WHERE e.id = c.id)
+  SELECT count(*) FROM archived"""
+
+def archive_shows(years=None, batch_size=5000, rows_per_second=20000, now=None):
+  # move the live shows older than `years` (SHOWS_ARCHIVE_YEARS) to shows_archive in short, rate limited batches
+  # like purge_deleted(), then drop the monthly partitions this emptied. Returns (shows archived, partitions dropped)
+  now = now or datetime.now()
+  cutoff = now - relativedelta(years=years or app.config['SHOWS_ARCHIVE_YEARS'])
+  archived = 0
+  while True:
+    started = time.perf_counter()
+    rolled_until = db.session.execute(text('SELECT rolled_until FROM show_counter_state FOR UPDATE')).scalar()
+    moved = db.session.execute(text(ARCHIVE_SHOWS), {'cutoff': cutoff, 'batch_size': batch_size, 'rolled_until': rolled_until}).scalar()
+    db.session.commit()
+    archived += moved
+    if moved < batch_size:
+      break
+    time.sleep(max(0, moved / rows_per_second - (time.perf_counter() - started)))
+
+  dropped = []
+  for partition in show_partitions(cutoff):
+    # tombstoned shows keep a partition until `flask purge-deleted` removed them
+    if db.session.execute(text(f'SELECT NOT EXISTS (SELECT 1 FROM {partition})')).scalar():
+      db.session.execute(text(f'ALTER TABLE shows DETACH PARTITION {partition}'))
+      db.session.execute(text(f'DROP TABLE {partition}'))
+      db.session.commit()
+      dropped.append(partition)
+  return archived, dropped
+
+@app.cli.command('purge-deleted')
+@click.option('--batch-size', default=500, show_default=True, help='Rows deleted per transaction.')
+@click.option('--rows-per-second', default=2000, show_default=True, help='Rate limit across batches.')
+def purge_deleted_command(batch_size, rows_per_second):
+  """Remove tombstoned shows, venues and artists in small batches. Run it periodically (e.g. cron every hour)."""
+  purged = purge_deleted(batch_size, rows_per_second)
+  click.echo(', '.join(f'{count} {table}' for table, count in purged.items()) + ' purged')
+
+@app.cli.command('roll-show-counters')
+def roll_show_counters_command():
+  """Move shows that have started from the upcoming to the past counters. Run it periodically (e.g. cron every 5 minutes)."""
+  moved = roll_show_counters()
+  click.echo(f'{moved} venue/artist counters updated')
+
+@app.cli.command('check-show-counters')
+@click.option('--repair', is_flag=True, help='Overwrite drifted counters with the recounted values.')
+def check_show_counters_command(repair):
+  """Recount shows per venue and artist and report (or repair) counters that drifted."""
+  drift = check_show_counters(repair=repair)
+  for table, row in drift:
+    click.echo(f'{table} {row.id}: upcoming {row.upcoming_shows_count} -> {row.upcoming}, past {row.past_shows_count} -> {row.past}')
+  click.echo(f'{len(drift)} counters drifted' + (', repaired' if repair and drift else ''))
+
+@app.cli.command('archive-shows')
+@click.option('--years', type=int, help='Archive shows older than this, SHOWS_ARCHIVE_YEARS by default.')
+@click.option('--batch-size', default=5000, show_default=True, help='Shows moved per transaction.')
+@click.option('--rows-per-second', default=20000, show_default=True, help='Rate limit across batches.')
+def archive_shows_command(years, batch_size, rows_per_second):
+  """Move old shows from shows to shows_archive and drop the partitions left empty. Run it periodically (e.g. cron every night)."""
+  archived, dropped = archive_shows(years, batch_size, rows_per_second)
+  click.echo(f'{archived} shows archived' + (', ' + ', '.join(dropped) + ' dropped' if dropped else ''))
+
+@app.cli.command('compile-templates')
+def compile_templates_command():
+  """Compile every template into JINJA_BYTECODE_CACHE_DIR, so that new workers skip the Jinja compiler. Run it at deploy."""
+  names = app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+  for name in names:
+    app.jinja_env.get_template(name)    # loading stores the bytecode, or finds it current
+  click.echo(f'{len(names)} templates compiled')
+
+@app.cli.command('profile-token')
+def profile_token_command():
+  """Print an X-Profile header value that profiles any request carrying it, for PROFILE_TOKEN_SECONDS."""
+  if not profile_tokens:
+    raise click.ClickException('PROFILE_SIGNING_KEY is not set')
+  click.echo('X-Profile: ' + profile_tokens.dumps('profile'))
+
+@app.cli.command('create-show-partitions')
+@click.option('--months-ahead', default=12, show_default=True, help='Months after the current one to create.')
+def create_show_partitions_command(months_ahead):
+  """Create the monthly partitions of shows ahead of time. Run it periodically (e.g. cron on the 1st of every month)."""
+  created = create_show_partitions(months_ahead)
+  click.echo(', '.join(created) + ' created' if created else 'all partitions exist')
+
+@app.cli.command('detach-show-partitions')
+@click.option('--keep-months', default=24, show_default=True, help='Past months that stay attached.')
+def detach_show_partitions_command(keep_months):
+  """Detach the monthly partitions of shows older than --keep-months into standalone tables."""
+  detached = detach_show_partitions(keep_months)
+  click.echo(', '.join(detached) + ' detached' if detached else 'nothing to detach')
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -1,46 +1,52 @@
 from datetime import datetime
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, FieldList
-from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, Regexp, Optional
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, DateField, BooleanField, FieldList, IntegerField, HiddenField
+from wtforms.widgets import HiddenInput
+from wtforms.validators import DataRequired, AnyOf, URL, ValidationError, Regexp, Optional, Length, NumberRange
 import re
+import uuid
 
 def validate_phone(form, field):                        
     if not re.search(r"^[0-9]{3}-[0-9]{3}-[0-9]{4}$", field.data):
         raise ValidationError("Invalid phone number.")
 
-genres_choices=[
-        ('Alternative', 'Alternative'),
-        ('Blues', 'Blues'),
-        ('Classical', 'Classical'),
-        ('Country', 'Country'),
-        ('Electronic', 'Electronic'),
-        ('Folk', 'Folk'),
-        ('Funk', 'Funk'),
-        ('Hip-Hop', 'Hip-Hop'),
-        ('Heavy Metal', 'Heavy Metal'),
-        ('Instrumental', 'Instrumental'),
-        ('Jazz', 'Jazz'),
-        ('Musical Theatre', 'Musical Theatre'),
-        ('Pop', 'Pop'),
-        ('Punk', 'Punk'),
-        ('R&B', 'R&B'),
-        ('Reggae', 'Reggae'),
-        ('Rock n Roll', 'Rock n Roll'),
-        ('Soul', 'Soul'),
-        ('Other', 'Other'),
-    ]
+# ids of the genres reference table, pinned here: migration d4d13af9a927 seeds the table from this map, and the
+# choices below list the genres in its order. A new genre gets the next unused id (and a migration inserting it);
+# never renumber or reuse one
+genre_ids = {
+    'Alternative': 1,
+    'Blues': 2,
+    'Classical': 3,
+    'Country': 4,
+    'Electronic': 5,
+    'Folk': 6,
+    'Funk': 7,
+    'Hip-Hop': 8,
+    'Heavy Metal': 9,
+    'Instrumental': 10,
+    'Jazz': 11,
+    'Musical Theatre': 12,
+    'Pop': 13,
+    'Punk': 14,
+    'R&B': 15,
+    'Reggae': 16,
+    'Rock n Roll': 17,
+    'Soul': 18,
+    'Other': 19,
+}
+
+genres_choices = [(name, name) for name in genre_ids]
 
 def custom_genres_validator(form, field):                   # enum restriction validator
-        genres_values = [choice[1] for choice in genres_choices]
         for value in field.data:
-            if value not in genres_values:
+            if value not in genre_ids:      # dict lookup instead of scanning genres_choices
                 raise ValidationError('Invalid genres value.')
 
 class ShowForm(FlaskForm):
-    artist_id = StringField(
+    artist_id = IntegerField(
         'artist_id', validators=[DataRequired()]
     )
-    venue_id = StringField(
+    venue_id = IntegerField(
         'venue_id', validators=[DataRequired()]
     )
     start_time = DateTimeField(
@@ -48,6 +54,24 @@ class ShowForm(FlaskForm):
         validators=[DataRequired()],
         default= datetime.today()
     )
+    duration = IntegerField(     # minutes, stored as shows.end_time. Overlapping shows of a venue or an artist are refused
+        'duration', validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+    repeat = SelectField(        # a series of shows, expanded with dateutil.rrule up to repeat_count / repeat_until
+        'repeat', default='',
+        choices=[('', 'Does not repeat'), ('DAILY', 'Daily'), ('WEEKLY', 'Weekly'), ('MONTHLY', 'Monthly')]
+    )
+    repeat_count = IntegerField(
+        'repeat_count', validators=[Optional(), NumberRange(min=1, max=366)]
+    )
+    repeat_until = DateField(
+        'repeat_until', validators=[Optional()]
+    )
+    idempotency_key = HiddenField(     # one per rendered form: a double-click or a retried post lists the show once
+        'idempotency_key', validators=[Optional(), Length(max=64)],
+        default=lambda: uuid.uuid4().hex
+    )
 
 class VenueForm(FlaskForm):
 
@@ -239,4 +263,19 @@ class ArtistForm(FlaskForm):
         'facebook_link', validators=[Optional(), URL()] # only if provided check URL validation else stop validation chain
     )
 
+class EditVenueForm(VenueForm):
+    version = IntegerField(      # venues.version the form was rendered from, for the optimistic locking of the edit
+        'version', validators=[DataRequired()], widget=HiddenInput()
+    )
+
+class EditArtistForm(ArtistForm):
+    version = IntegerField(
+        'version', validators=[DataRequired()], widget=HiddenInput()
+    )
+
+class ProfileRequestsForm(FlaskForm):
+    requests = IntegerField(     # the next N requests of this worker get profiled, 0 disarms
+        'requests', validators=[NumberRange(min=0, max=100)], default=5
+    )
+
 # TODO IMPLEMENT NEW ARTIST FORM AND NEW SHOW FORM
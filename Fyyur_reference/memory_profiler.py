@@ -0,0 +1,98 @@
+import random
+import threading
+import tracemalloc
+
+class MemoryProfiler:
+    """tracemalloc snapshots around sampled requests: peak and retained allocation per endpoint, and the allocation
+    sites (file:line) that kept the most memory after the requests ended.
+
+    Peak is the highest traced memory during the request above what was traced when it started; retained is what
+    the request allocated and did not free by its teardown (caches filled, leaks). tracemalloc is process wide, so
+    one request is measured at a time and requests of other threads running alongside are counted in. Tracing is
+    started for the first measured request and stopped again once no more are wanted, so it costs nothing unless
+    `sample_rate` is set or the admin page armed it.
+    """
+
+    def __init__(self, sample_rate=0.0, frames=1, max_sites=1000):
+        self.sample_rate, self.frames, self.max_sites = sample_rate, frames, max_sites
+        self.armed = 0          # requests still to measure, see arm()
+        self._started_tracing = False   # tracing started here, not by PYTHONTRACEMALLOC, so ours to stop
+        self._measuring = threading.Lock()
+        self._lock = threading.Lock()
+        self._routes = {}       # endpoint -> {'count', 'peak_total', 'peak_max', 'retained_total', 'retained_max'}
+        self._sites = {}        # 'file:line' -> {'retained', 'count', 'routes'}
+
+    def arm(self, requests):
+        with self._lock:
+            self.armed = requests
+
+    def take(self):
+        # True when this request should be measured, either armed or sampled. An armed request is only counted off
+        # by start(), once it got to be measured: one that finds another request being measured keeps its place
+        return bool(self.armed) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self):
+        # snapshot before the request, or None when another request is being measured
+        if not self._measuring.acquire(blocking=False):
+            return None
+        with self._lock:
+            if self.armed:
+                self.armed -= 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        return self._snapshot(), tracemalloc.get_traced_memory()[0]
+
+    def finish(self, started, route):
+        before, traced_before = started
+        try:
+            peak = tracemalloc.get_traced_memory()[1] - traced_before
+            differences = self._snapshot().compare_to(before, 'lineno')
+            retained = sum(difference.size_diff for difference in differences)
+            self._record(route or 'none', peak, retained, differences)
+            if self._started_tracing and not self.armed and not self.sample_rate:
+                tracemalloc.stop()
+                self._started_tracing = False
+        finally:
+            self._measuring.release()
+        return peak, retained
+
+    def routes(self):
+        # [{'route', 'count', 'peak_mean', 'peak_max', 'retained_mean', 'retained_max'}] by mean peak, largest first
+        with self._lock:
+            rows = [dict(stats, route=route) for route, stats in self._routes.items()]
+        for row in rows:
+            row['peak_mean'], row['retained_mean'] = row.pop('peak_total') / row['count'], row.pop('retained_total') / row['count']
+        return sorted(rows, key=lambda row: row['peak_mean'], reverse=True)
+
+    def top_sites(self, limit=30):
+        # [{'site', 'retained', 'count', 'routes'}], the sites that kept the most bytes over all measured requests
+        with self._lock:
+            rows = [dict(stats, site=site, routes=sorted(stats['routes'])) for site, stats in self._sites.items()]
+        return sorted(rows, key=lambda row: row['retained'], reverse=True)[:limit]
+
+    def _snapshot(self):
+        # leave out the allocations of tracemalloc itself (the previous snapshot)
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    def _record(self, route, peak, retained, differences):
+        with self._lock:
+            stats = self._routes.setdefault(route, {'count': 0, 'peak_total': 0, 'peak_max': 0, 'retained_total': 0, 'retained_max': 0})
+            stats['count'] += 1
+            stats['peak_total'] += peak
+            stats['peak_max'] = max(stats['peak_max'], peak)
+            stats['retained_total'] += retained
+            stats['retained_max'] = max(stats['retained_max'], retained)
+            for difference in differences:
+                if difference.size_diff <= 0:
+                    continue
+                frame = difference.traceback[0]
+                site = self._sites.get(frame.filename + ':' + str(frame.lineno))
+                if site is None:
+                    if len(self._sites) >= self.max_sites:      # bounded: new sites past that are only counted in the route
+                        continue
+                    site = self._sites[frame.filename + ':' + str(frame.lineno)] = {'retained': 0, 'count': 0, 'routes': set()}
+                site['retained'] += difference.size_diff
+                site['count'] += difference.count_diff
+                site['routes'].add(route)
@@ -0,0 +1,49 @@
+import collections
+import threading
+
+class Metrics:
+    """Timings and counters of this process, for the admin metrics page.
+
+    A timing keeps its count, total and maximum since the start, and the last `window` values for the percentiles,
+    so memory stays bounded however long the worker runs. Names are dotted, e.g. "template.pages/show_venue.html"
+    or "route.show_venue.sql_ms".
+    """
+
+    def __init__(self, window=1024):
+        self._window = window
+        self._timings = {}      # name -> {'count', 'total', 'max', 'recent'}
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def timing(self, name, value):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'recent': collections.deque(maxlen=self._window)}
+            timing['count'] += 1
+            timing['total'] += value
+            timing['max'] = max(timing['max'], value)
+            timing['recent'].append(value)
+
+    def increment(self, name, count=1):
+        with self._lock:
+            self._counters[name] += count
+
+    def timings(self, prefix=''):
+        # [{'name', 'count', 'mean', 'p50', 'p95', 'max'}] sorted by name; percentiles of the recent window
+        with self._lock:
+            copied = [(name, dict(timing, recent=sorted(timing['recent']))) for name, timing in self._timings.items() if name.startswith(prefix)]
+        return [{'name': name, 'count': timing['count'], 'mean': timing['total'] / timing['count'], 'max': timing['max'],
+                 'p50': self.percentile(timing['recent'], 50), 'p95': self.percentile(timing['recent'], 95)}
+                for name, timing in sorted(copied)]
+
+    def counters(self, prefix=''):
+        with self._lock:
+            return {name: count for name, count in sorted(self._counters.items()) if name.startswith(prefix)}
+
+    @staticmethod
+    def percentile(ordered, percent):
+        # nearest rank on an already sorted list
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, max(0, int(round(percent / 100.0 * len(ordered))) - 1))]
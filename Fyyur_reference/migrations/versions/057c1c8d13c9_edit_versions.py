@@ -0,0 +1,27 @@
+"""version columns on venues and artists for the optimistic locking of the edit forms
+
+Revision ID: 057c1c8d13c9
+Revises: 975fd5bbf664
+Create Date: 2026-10-19 14:48:31.214870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '057c1c8d13c9'
+down_revision = '975fd5bbf664'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # constant default: stored in the catalog, no table rewrite
+    op.add_column('venues', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('artists', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('artists', 'version')
+    op.drop_column('venues', 'version')
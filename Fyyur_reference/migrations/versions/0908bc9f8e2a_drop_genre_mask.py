@@ -0,0 +1,31 @@
+"""drop genre_mask: the searches filter genres on the GIN indexed genres array, like the listings
+
+Revision ID: 0908bc9f8e2a
+Revises: 62f31502b55e
+Create Date: 2026-10-20 09:12:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0908bc9f8e2a'
+down_revision = '62f31502b55e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_column('artists', 'genre_mask')
+    op.drop_column('venues', 'genre_mask')
+
+
+def downgrade():
+    op.add_column('venues', sa.Column('genre_mask', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('genre_mask', sa.BigInteger(), server_default='0', nullable=False))
+    for table in ('venues', 'artists'):
+        op.execute(f"""
+            UPDATE {table} SET genre_mask = coalesce(
+                (SELECT bit_or(1::bigint << (g.id - 1)) FROM genres g WHERE g.name = ANY({table}.genres)), 0)
+            WHERE genres IS NOT NULL""")
@@ -0,0 +1,51 @@
+"""shows_archive: cold storage for shows older than SHOWS_ARCHIVE_YEARS
+
+Revision ID: 62f31502b55e
+Revises: c38e6a177920
+Create Date: 2026-10-19 20:11:36.408215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '62f31502b55e'
+down_revision = 'c38e6a177920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # only what the past shows pages read: no tombstone (tombstoned shows are purged, not archived), no idempotency
+    # key, no overlap constraints. Filled by `flask archive-shows`
+    op.create_table('shows_archive',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_shows_archive_venue_id_start_time', 'shows_archive', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_archive_artist_id_start_time', 'shows_archive', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    # archived shows go back to shows. They are in the counters already and the insert trigger counts them again,
+    # so they come off first
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(f"""
+            UPDATE {table} SET upcoming_shows_count = {table}.upcoming_shows_count - archived.upcoming,
+                               past_shows_count = {table}.past_shows_count - archived.past
+            FROM (SELECT a.{column} AS id, count(*) FILTER (WHERE a.start_time > s.rolled_until) AS upcoming,
+                         count(*) FILTER (WHERE a.start_time <= s.rolled_until) AS past
+                  FROM shows_archive a, show_counter_state s GROUP BY a.{column}) archived
+            WHERE {table}.id = archived.id""")
+    op.execute('INSERT INTO shows (id, artist_id, venue_id, start_time, end_time) '
+               'SELECT id, artist_id, venue_id, start_time, end_time FROM shows_archive')
+    op.drop_index('ix_shows_archive_artist_id_start_time', table_name='shows_archive')
+    op.drop_index('ix_shows_archive_venue_id_start_time', table_name='shows_archive')
+    op.drop_table('shows_archive')
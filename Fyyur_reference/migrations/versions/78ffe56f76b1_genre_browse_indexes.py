@@ -0,0 +1,32 @@
+"""GIN indexes on genres and area indexes for the genre browse filters
+
+Revision ID: 78ffe56f76b1
+Revises: d4d13af9a927
+Create Date: 2026-10-19 13:15:52.270931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '78ffe56f76b1'
+down_revision = 'd4d13af9a927'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY can't run inside the migration transaction, but keeps venues/artists writable while it builds
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venues_genres', 'venues', ['genres'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_artists_genres', 'artists', ['genres'], unique=False, postgresql_using='gin', postgresql_concurrently=True)
+        op.create_index('ix_venues_state_city', 'venues', ['state', 'city'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_artists_state_city', 'artists', ['state', 'city'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_artists_state_city', table_name='artists')
+    op.drop_index('ix_venues_state_city', table_name='venues')
+    op.drop_index('ix_artists_genres', table_name='artists')
+    op.drop_index('ix_venues_genres', table_name='venues')
@@ -0,0 +1,27 @@
+"""shows by artist and start time, for the artist calendars
+
+Revision ID: 7a9bbce06578
+Revises: db0e164d5f69
+Create Date: 2026-10-19 18:36:10.402618
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a9bbce06578'
+down_revision = 'db0e164d5f69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # not partial, like ix_shows_venue_id_start_time: the ON DELETE CASCADE lookups by artist_id use it too
+    with op.get_context().autocommit_block():
+        op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shows_artist_id_start_time', table_name='shows', postgresql_concurrently=True)
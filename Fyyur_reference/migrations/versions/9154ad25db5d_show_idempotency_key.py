@@ -0,0 +1,28 @@
+"""idempotency key on shows for retried and double submitted show listings
+
+Revision ID: 9154ad25db5d
+Revises: 057c1c8d13c9
+Create Date: 2026-10-19 15:20:06.518342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9154ad25db5d'
+down_revision = '057c1c8d13c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('ix_shows_idempotency_key', 'shows', ['idempotency_key'], unique=True,
+                        postgresql_where=sa.text('idempotency_key IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade():
+    op.drop_index('ix_shows_idempotency_key', table_name='shows')
+    op.drop_column('shows', 'idempotency_key')
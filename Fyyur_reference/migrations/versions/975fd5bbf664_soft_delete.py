@@ -0,0 +1,108 @@
+"""soft delete: deleted_at tombstones and live-row partial indexes
+
+Revision ID: 975fd5bbf664
+Revises: 78ffe56f76b1
+Create Date: 2026-10-19 14:02:27.660183
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '975fd5bbf664'
+down_revision = '78ffe56f76b1'
+branch_labels = None
+depends_on = None
+
+
+# indexes that become partial (WHERE deleted_at IS NULL): (name, table, columns, using)
+LIVE_INDEXES = [
+    ('ix_venues_search_vector', 'venues', ['search_vector'], 'gin'),
+    ('ix_venues_genres', 'venues', ['genres'], 'gin'),
+    ('ix_venues_state_city', 'venues', ['state', 'city'], None),
+    ('ix_artists_search_vector', 'artists', ['search_vector'], 'gin'),
+    ('ix_artists_genres', 'artists', ['genres'], 'gin'),
+    ('ix_artists_state_city', 'artists', ['state', 'city'], None),
+    ('ix_shows_start_time', 'shows', ['start_time'], None),
+]
+
+
+def show_counters_function(live_rows):
+    # fyyur_show_counters() of b5e5a49b35bf, counting only the transition rows matching live_rows
+    return f"""
+CREATE OR REPLACE FUNCTION fyyur_show_counters() RETURNS trigger AS $$
+DECLARE
+  rolled_until timestamp;
+  delta text;
+BEGIN
+  SELECT s.rolled_until INTO rolled_until FROM show_counter_state s FOR SHARE;
+  IF TG_OP = 'INSERT' THEN
+    delta := 'SELECT venue_id, artist_id, start_time, 1 AS n FROM new_rows {live_rows}';
+  ELSIF TG_OP = 'DELETE' THEN
+    delta := 'SELECT venue_id, artist_id, start_time, -1 AS n FROM old_rows {live_rows}';
+  ELSE
+    delta := 'SELECT venue_id, artist_id, start_time, 1 AS n FROM new_rows {live_rows} '
+             'UNION ALL SELECT venue_id, artist_id, start_time, -1 AS n FROM old_rows {live_rows}';
+  END IF;
+  EXECUTE format(
+    'UPDATE venues e SET upcoming_shows_count = e.upcoming_shows_count + d.upcoming, '
+    '                    past_shows_count = e.past_shows_count + d.past '
+    'FROM (SELECT venue_id AS id, coalesce(sum(n) FILTER (WHERE start_time > $1), 0) AS upcoming, '
+    '             coalesce(sum(n) FILTER (WHERE start_time <= $1), 0) AS past '
+    '      FROM (%s) delta GROUP BY venue_id) d '
+    'WHERE e.id = d.id AND (d.upcoming <> 0 OR d.past <> 0)', delta) USING rolled_until;
+  EXECUTE format(
+    'UPDATE artists e SET upcoming_shows_count = e.upcoming_shows_count + d.upcoming, '
+    '                     past_shows_count = e.past_shows_count + d.past '
+    'FROM (SELECT artist_id AS id, coalesce(sum(n) FILTER (WHERE start_time > $1), 0) AS upcoming, '
+    '             coalesce(sum(n) FILTER (WHERE start_time <= $1), 0) AS past '
+    '      FROM (%s) delta GROUP BY artist_id) d '
+    'WHERE e.id = d.id AND (d.upcoming <> 0 OR d.past <> 0)', delta) USING rolled_until;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def rebuild_index(name, table, columns, using, where):
+    # build the replacement next to the old index, then swap names, so reads never run without an index
+    op.create_index(name + '_new', table, columns, unique=False, postgresql_using=using,
+                    postgresql_where=sa.text(where) if where else None, postgresql_concurrently=True)
+    op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    op.execute(f'ALTER INDEX {name}_new RENAME TO {name}')
+
+
+def upgrade():
+    # nullable without default: no table rewrite
+    op.add_column('venues', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('artists', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.add_column('shows', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.execute(show_counters_function('WHERE deleted_at IS NULL'))
+
+    with op.get_context().autocommit_block():
+        for name, table, columns, using in LIVE_INDEXES:
+            rebuild_index(name, table, columns, using, 'deleted_at IS NULL')
+        # by venue_id for the detail pages, the purge job and the ON DELETE CASCADE lookups (so not partial)
+        op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False, postgresql_concurrently=True)
+        for table in ('venues', 'artists', 'shows'):
+            op.create_index(f'ix_{table}_tombstoned', table, ['id'], unique=False,
+                            postgresql_where=sa.text('deleted_at IS NOT NULL'), postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for table in ('venues', 'artists', 'shows'):
+            op.drop_index(f'ix_{table}_tombstoned', table_name=table, postgresql_concurrently=True)
+        op.drop_index('ix_shows_venue_id_start_time', table_name='shows', postgresql_concurrently=True)
+        for name, table, columns, using in LIVE_INDEXES:
+            rebuild_index(name, table, columns, using, None)
+
+    # tombstoned rows would come back to life, remove them for good (while the counters still ignore them)
+    op.execute('DELETE FROM shows WHERE deleted_at IS NOT NULL')
+    op.execute('DELETE FROM venues WHERE deleted_at IS NOT NULL')
+    op.execute('DELETE FROM artists WHERE deleted_at IS NOT NULL')
+    op.execute(show_counters_function(''))
+    op.drop_column('shows', 'deleted_at')
+    op.drop_column('artists', 'deleted_at')
+    op.drop_column('venues', 'deleted_at')
@@ -0,0 +1,52 @@
+"""show end times and exclusion constraints against overlapping shows of a venue or an artist
+
+Revision ID: ad3830e56d5e
+Revises: 9154ad25db5d
+Create Date: 2026-10-19 15:51:44.030918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ad3830e56d5e'
+down_revision = '9154ad25db5d'
+branch_labels = None
+depends_on = None
+
+
+DEFAULT_DURATION = "interval '2 hours'"     # end time given to the shows listed before this revision
+
+OVERLAPS = """
+    SELECT count(*) FROM shows a JOIN shows b ON a.{column} = b.{column} AND a.id < b.id
+    WHERE a.deleted_at IS NULL AND b.deleted_at IS NULL
+      AND tsrange(a.start_time, a.end_time) && tsrange(b.start_time, b.end_time)"""
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute(f'UPDATE shows SET end_time = start_time + {DEFAULT_DURATION}')
+    op.alter_column('shows', 'end_time', nullable=False)
+    op.create_check_constraint('shows_end_after_start', 'shows', 'end_time > start_time')
+
+    # the constraints would fail on the first overlapping pair, report them all at once instead
+    connection = op.get_bind()
+    for column in ('venue_id', 'artist_id'):
+        overlaps = connection.execute(sa.text(OVERLAPS.format(column=column))).scalar()
+        if overlaps:
+            raise RuntimeError(f'{overlaps} pairs of overlapping shows with the same {column}, '
+                               'move or delete one show of each pair before upgrading')
+
+    # builds the GiST indexes under an ACCESS EXCLUSIVE lock on shows (constraints can't be built CONCURRENTLY).
+    # int4range(id, id, '[]') WITH = rather than id WITH =, which would need the btree_gist extension
+    for column in ('venue_id', 'artist_id'):
+        op.execute(f"ALTER TABLE shows ADD CONSTRAINT shows_{column[:-3]}_no_overlap EXCLUDE USING gist "
+                   f"(int4range({column}, {column}, '[]') WITH =, tsrange(start_time, end_time) WITH &&) WHERE (deleted_at IS NULL)")
+
+
+def downgrade():
+    op.drop_constraint('shows_artist_no_overlap', 'shows')
+    op.drop_constraint('shows_venue_no_overlap', 'shows')
+    op.drop_constraint('shows_end_after_start', 'shows')
+    op.drop_column('shows', 'end_time')
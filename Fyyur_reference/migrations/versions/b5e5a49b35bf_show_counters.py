@@ -0,0 +1,104 @@
+"""denormalized upcoming/past show counters on venues and artists
+
+Revision ID: b5e5a49b35bf
+Revises: b313b15f5556
+Create Date: 2026-10-19 11:20:04.512390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e5a49b35bf'
+down_revision = 'b313b15f5556'
+branch_labels = None
+depends_on = None
+
+
+# Statement level triggers with transition tables, so a multi-row insert or a cascaded delete of a venue
+# costs one grouped UPDATE per table instead of one per show.
+# A show is upcoming when start_time > show_counter_state.rolled_until; `flask roll-show-counters` advances it.
+SHOW_COUNTERS_FUNCTION = """
+CREATE FUNCTION fyyur_show_counters() RETURNS trigger AS $$
+DECLARE
+  rolled_until timestamp;
+  delta text;
+BEGIN
+  SELECT s.rolled_until INTO rolled_until FROM show_counter_state s FOR SHARE;
+  IF TG_OP = 'INSERT' THEN
+    delta := 'SELECT venue_id, artist_id, start_time, 1 AS n FROM new_rows';
+  ELSIF TG_OP = 'DELETE' THEN
+    delta := 'SELECT venue_id, artist_id, start_time, -1 AS n FROM old_rows';
+  ELSE
+    delta := 'SELECT venue_id, artist_id, start_time, 1 AS n FROM new_rows '
+             'UNION ALL SELECT venue_id, artist_id, start_time, -1 AS n FROM old_rows';
+  END IF;
+  EXECUTE format(
+    'UPDATE venues e SET upcoming_shows_count = e.upcoming_shows_count + d.upcoming, '
+    '                    past_shows_count = e.past_shows_count + d.past '
+    'FROM (SELECT venue_id AS id, coalesce(sum(n) FILTER (WHERE start_time > $1), 0) AS upcoming, '
+    '             coalesce(sum(n) FILTER (WHERE start_time <= $1), 0) AS past '
+    '      FROM (%s) delta GROUP BY venue_id) d '
+    'WHERE e.id = d.id AND (d.upcoming <> 0 OR d.past <> 0)', delta) USING rolled_until;
+  EXECUTE format(
+    'UPDATE artists e SET upcoming_shows_count = e.upcoming_shows_count + d.upcoming, '
+    '                     past_shows_count = e.past_shows_count + d.past '
+    'FROM (SELECT artist_id AS id, coalesce(sum(n) FILTER (WHERE start_time > $1), 0) AS upcoming, '
+    '             coalesce(sum(n) FILTER (WHERE start_time <= $1), 0) AS past '
+    '      FROM (%s) delta GROUP BY artist_id) d '
+    'WHERE e.id = d.id AND (d.upcoming <> 0 OR d.past <> 0)', delta) USING rolled_until;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+SHOW_COUNTERS_TRIGGERS = [
+    'CREATE TRIGGER shows_counters_insert AFTER INSERT ON shows REFERENCING NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_counters()',
+    'CREATE TRIGGER shows_counters_delete AFTER DELETE ON shows REFERENCING OLD TABLE AS old_rows '
+    'FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_counters()',
+    'CREATE TRIGGER shows_counters_update AFTER UPDATE ON shows REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_counters()',
+]
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venues', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_shows_start_time'), 'shows', ['start_time'], unique=False)
+    op.create_table('show_counter_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO show_counter_state (id, rolled_until) VALUES (1, LOCALTIMESTAMP)')
+
+    # backfill from the existing shows before the triggers take over
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(f"""
+            UPDATE {table} SET upcoming_shows_count = c.upcoming, past_shows_count = c.past
+            FROM (SELECT {column} AS id,
+                         count(*) FILTER (WHERE start_time > (SELECT rolled_until FROM show_counter_state)) AS upcoming,
+                         count(*) FILTER (WHERE start_time <= (SELECT rolled_until FROM show_counter_state)) AS past
+                  FROM shows GROUP BY {column}) c
+            WHERE {table}.id = c.id""")
+
+    op.execute(SHOW_COUNTERS_FUNCTION)
+    for trigger in SHOW_COUNTERS_TRIGGERS:
+        op.execute(trigger)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER shows_counters_update ON shows')
+    op.execute('DROP TRIGGER shows_counters_delete ON shows')
+    op.execute('DROP TRIGGER shows_counters_insert ON shows')
+    op.execute('DROP FUNCTION fyyur_show_counters()')
+    op.drop_table('show_counter_state')
+    op.drop_index(op.f('ix_shows_start_time'), table_name='shows')
+    op.drop_column('artists', 'past_shows_count')
+    op.drop_column('artists', 'upcoming_shows_count')
+    op.drop_column('venues', 'past_shows_count')
+    op.drop_column('venues', 'upcoming_shows_count')
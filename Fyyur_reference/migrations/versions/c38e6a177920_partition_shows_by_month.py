@@ -0,0 +1,172 @@
+"""shows partitioned by month of start_time
+
+Revision ID: c38e6a177920
+Revises: 7a9bbce06578
+Create Date: 2026-10-19 19:24:52.117093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c38e6a177920'
+down_revision = '7a9bbce06578'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = 'id, artist_id, venue_id, start_time, end_time, deleted_at, idempotency_key'
+
+# same as in b5e5a49b35bf, created again on the new table
+SHOW_COUNTERS_TRIGGERS = [
+    'CREATE TRIGGER shows_counters_insert AFTER INSERT ON shows REFERENCING NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_counters()',
+    'CREATE TRIGGER shows_counters_delete AFTER DELETE ON shows REFERENCING OLD TABLE AS old_rows '
+    'FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_counters()',
+    'CREATE TRIGGER shows_counters_update AFTER UPDATE ON shows REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows '
+    'FOR EACH STATEMENT EXECUTE FUNCTION fyyur_show_counters()',
+]
+
+# Postgres 16 has no exclusion constraints on partitioned tables, so every partition gets its own pair
+NO_OVERLAP = """
+    ALTER TABLE {table} ADD CONSTRAINT {table}_{side}_no_overlap EXCLUDE USING gist
+      (int4range({side}_id, {side}_id, '[]') WITH =, tsrange(start_time, end_time) WITH &&) WHERE (deleted_at IS NULL)"""
+
+# Creates the partition of a month, e.g. shows_2026_11. Shows of that month that went to shows_default in the
+# meantime move over first (ATTACH refuses while the default partition holds rows of the range). The move goes
+# through the partitions directly, so the counter triggers of shows don't fire: the rows stay counted once
+CREATE_SHOW_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_create_show_partition(month timestamp) RETURNS boolean AS $$
+DECLARE
+  first_day timestamp := date_trunc('month', month);
+  partition text := 'shows_' || to_char(first_day, 'YYYY_MM');
+BEGIN
+  IF to_regclass(partition) IS NOT NULL THEN
+    RETURN false;
+  END IF;
+  EXECUTE format('CREATE TABLE %I (LIKE shows INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition);
+  EXECUTE format('WITH moved AS (DELETE FROM shows_default WHERE start_time >= $1 AND start_time < $2 RETURNING *) '
+                 'INSERT INTO %I SELECT * FROM moved', partition) USING first_day, first_day + interval '1 month';
+  EXECUTE format('ALTER TABLE shows ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                 partition, first_day, first_day + interval '1 month');
+  EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist '
+                 '(int4range(venue_id, venue_id, ''[]'') WITH =, tsrange(start_time, end_time) WITH &&) WHERE (deleted_at IS NULL)',
+                 partition, partition || '_venue_no_overlap');
+  EXECUTE format('ALTER TABLE %I ADD CONSTRAINT %I EXCLUDE USING gist '
+                 '(int4range(artist_id, artist_id, ''[]'') WITH =, tsrange(start_time, end_time) WITH &&) WHERE (deleted_at IS NULL)',
+                 partition, partition || '_artist_no_overlap');
+  RETURN true;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+# The per-partition constraints miss overlaps between two months: a show from 23:00 on the 31st to 01:00 and one at
+# 00:30 on the 1st. Shows last at most a day (shows_at_most_a_day), so only shows ending in the next month or starting
+# on the 1st can be involved; the trigger checks those against the other months, serialized per venue and artist
+BOUNDARY_OVERLAP_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_show_boundary_overlap() RETURNS trigger AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock(1, NEW.venue_id), pg_advisory_xact_lock(2, NEW.artist_id);
+  IF EXISTS (SELECT 1 FROM shows s
+             WHERE s.deleted_at IS NULL AND s.id <> NEW.id
+               AND date_trunc('month', s.start_time) <> date_trunc('month', NEW.start_time)
+               AND s.start_time < NEW.end_time AND s.start_time > NEW.start_time - interval '1 day'
+               AND (s.venue_id = NEW.venue_id OR s.artist_id = NEW.artist_id)
+               AND tsrange(s.start_time, s.end_time) && tsrange(NEW.start_time, NEW.end_time)) THEN
+    RAISE EXCEPTION 'show % overlaps a show of the neighbouring month', NEW.id
+      USING ERRCODE = 'exclusion_violation', CONSTRAINT = 'shows_boundary_no_overlap', TABLE = 'shows';
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+BOUNDARY_OVERLAP_TRIGGER = """
+CREATE TRIGGER shows_boundary_overlap BEFORE INSERT OR UPDATE ON shows FOR EACH ROW
+WHEN (NEW.deleted_at IS NULL AND (date_trunc('month', NEW.start_time) <> date_trunc('month', NEW.end_time - interval '1 microsecond')
+                                  OR NEW.start_time < date_trunc('month', NEW.start_time) + interval '1 day'))
+EXECUTE FUNCTION fyyur_show_boundary_overlap()"""
+
+
+def create_shows_table(partitioned):
+    kwargs = {'postgresql_partition_by': 'RANGE (start_time)'} if partitioned else {}
+    op.create_table('shows',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('shows_id_seq')"), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.Column('idempotency_key', sa.String(length=64), nullable=True),
+    sa.CheckConstraint('end_time > start_time', name='shows_end_after_start'),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], name='shows_artist_id_fkey', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['venues.id'], name='shows_venue_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'start_time') if partitioned else sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('artist_id', 'venue_id', 'start_time', name='_artist_venue_starttime_uc'),
+    **kwargs
+    )
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY shows.id')
+    op.create_index('ix_shows_start_time', 'shows', ['start_time'], unique=False, postgresql_where=sa.text('deleted_at IS NULL'))
+    op.create_index('ix_shows_venue_id_start_time', 'shows', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_artist_id_start_time', 'shows', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_shows_tombstoned', 'shows', ['id'], unique=False, postgresql_where=sa.text('deleted_at IS NOT NULL'))
+    # a unique index of a partitioned table has to contain start_time: a key is unique per start time from here on
+    op.create_index('ix_shows_idempotency_key', 'shows', ['idempotency_key', 'start_time'] if partitioned else ['idempotency_key'],
+                    unique=True, postgresql_where=sa.text('idempotency_key IS NOT NULL'))
+
+
+def set_aside_shows_table(constraints, indexes):
+    # renamed out of the way; the new table takes back the names of its indexes (and index backed constraints)
+    op.execute('LOCK TABLE shows IN ACCESS EXCLUSIVE MODE')
+    op.execute('ALTER TABLE shows RENAME TO shows_old')
+    op.execute('ALTER SEQUENCE shows_id_seq OWNED BY NONE')
+    for constraint in constraints:
+        op.drop_constraint(constraint, 'shows_old')
+    for index in indexes:
+        op.drop_index(index, table_name='shows_old')
+
+
+def upgrade():
+    # rewrites shows under an ACCESS EXCLUSIVE lock: plan a maintenance window on a large table
+    set_aside_shows_table(['shows_pkey', '_artist_venue_starttime_uc', 'shows_venue_no_overlap', 'shows_artist_no_overlap'],
+                          ['ix_shows_start_time', 'ix_shows_venue_id_start_time', 'ix_shows_artist_id_start_time',
+                           'ix_shows_tombstoned', 'ix_shows_idempotency_key'])
+    create_shows_table(partitioned=True)
+    op.create_check_constraint('shows_at_most_a_day', 'shows', "end_time <= start_time + interval '1 day'")
+
+    # rows outside the monthly partitions land in shows_default until `flask create-show-partitions` covers them
+    op.execute('CREATE TABLE shows_default PARTITION OF shows DEFAULT')
+    for side in ('venue', 'artist'):
+        op.execute(NO_OVERLAP.format(table='shows_default', side=side))
+    op.execute(CREATE_SHOW_PARTITION_FUNCTION)
+    # the months holding shows and the coming year
+    op.execute("""
+        SELECT fyyur_create_show_partition(month) FROM (
+            SELECT DISTINCT date_trunc('month', start_time) AS month FROM shows_old
+            UNION SELECT generate_series(date_trunc('month', LOCALTIMESTAMP), date_trunc('month', LOCALTIMESTAMP) + interval '12 months', interval '1 month')
+        ) months ORDER BY month""")
+
+    # before the triggers: the counters already include these shows
+    op.execute(f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM shows_old')
+    op.drop_table('shows_old')
+    for trigger in SHOW_COUNTERS_TRIGGERS:
+        op.execute(trigger)
+    op.execute(BOUNDARY_OVERLAP_FUNCTION)
+    op.execute(BOUNDARY_OVERLAP_TRIGGER)
+
+
+def downgrade():
+    # detached partitions (`flask detach-show-partitions`) are not brought back; the attached ones go with shows_old
+    set_aside_shows_table(['shows_pkey', '_artist_venue_starttime_uc'],
+                          ['ix_shows_start_time', 'ix_shows_venue_id_start_time', 'ix_shows_artist_id_start_time',
+                           'ix_shows_tombstoned', 'ix_shows_idempotency_key'])
+    create_shows_table(partitioned=False)
+    op.execute(f'INSERT INTO shows ({COLUMNS}) SELECT {COLUMNS} FROM shows_old')
+    op.drop_table('shows_old')
+    for trigger in SHOW_COUNTERS_TRIGGERS:
+        op.execute(trigger)
+    for side in ('venue', 'artist'):
+        op.execute(NO_OVERLAP.format(table='shows', side=side))
+    op.execute('DROP FUNCTION fyyur_show_boundary_overlap()')
+    op.execute('DROP FUNCTION fyyur_create_show_partition(timestamp)')
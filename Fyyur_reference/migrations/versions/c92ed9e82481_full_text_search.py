@@ -0,0 +1,52 @@
+"""full text search vectors on venues and artists
+
+Revision ID: c92ed9e82481
+Revises: b5e5a49b35bf
+Create Date: 2026-10-19 12:02:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'c92ed9e82481'
+down_revision = 'b5e5a49b35bf'
+branch_labels = None
+depends_on = None
+
+
+# array_to_string() is only STABLE, which generated columns don't accept. For text[] it is immutable in
+# practice, so wrap it.
+ARRAY_TEXT_FUNCTION = """
+CREATE FUNCTION fyyur_array_text(text[]) RETURNS text AS $$
+  SELECT coalesce(array_to_string($1, ' '), '')
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE
+"""
+
+VENUE_SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(city, '') || ' ' || coalesce(state, '')), 'B') || "
+    "setweight(to_tsvector('english', fyyur_array_text(genres)), 'B')"
+)
+
+ARTIST_SEARCH_VECTOR = VENUE_SEARCH_VECTOR + (
+    " || setweight(to_tsvector('english', fyyur_array_text(\"albumsL\") || ' ' || fyyur_array_text(\"songsL\")), 'C')"
+)
+
+
+def upgrade():
+    op.execute(ARRAY_TEXT_FUNCTION)
+    op.add_column('venues', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(VENUE_SEARCH_VECTOR, persisted=True), nullable=True))
+    op.add_column('artists', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(ARTIST_SEARCH_VECTOR, persisted=True), nullable=True))
+    op.create_index('ix_venues_search_vector', 'venues', ['search_vector'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artists_search_vector', 'artists', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_artists_search_vector', table_name='artists')
+    op.drop_index('ix_venues_search_vector', table_name='venues')
+    op.drop_column('artists', 'search_vector')
+    op.drop_column('venues', 'search_vector')
+    op.execute('DROP FUNCTION fyyur_array_text(text[])')
@@ -0,0 +1,43 @@
+"""genres reference table and genre_mask on venues and artists
+
+Revision ID: d4d13af9a927
+Revises: c92ed9e82481
+Create Date: 2026-10-19 12:41:09.803517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from forms import genre_ids     # the pinned ids, shared with the forms
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4d13af9a927'
+down_revision = 'c92ed9e82481'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    genres = op.create_table('genres',
+    sa.Column('id', sa.SmallInteger(), autoincrement=False, nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    op.bulk_insert(genres, [{'id': number, 'name': name} for name, number in genre_ids.items()])
+    op.add_column('venues', sa.Column('genre_mask', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('artists', sa.Column('genre_mask', sa.BigInteger(), server_default='0', nullable=False))
+
+    # data migration: genres outside the reference table (free text from before the form validation) get no bit
+    for table in ('venues', 'artists'):
+        op.execute(f"""
+            UPDATE {table} SET genre_mask = coalesce(
+                (SELECT bit_or(1::bigint << (g.id - 1)) FROM genres g WHERE g.name = ANY({table}.genres)), 0)
+            WHERE genres IS NOT NULL""")
+
+
+def downgrade():
+    op.drop_column('artists', 'genre_mask')
+    op.drop_column('venues', 'genre_mask')
+    op.drop_table('genres')
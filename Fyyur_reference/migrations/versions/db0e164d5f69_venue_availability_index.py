@@ -0,0 +1,32 @@
+"""venues of a city ordered by name, for the availability search
+
+Revision ID: db0e164d5f69
+Revises: ad3830e56d5e
+Create Date: 2026-10-19 17:12:38.845170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'db0e164d5f69'
+down_revision = 'ad3830e56d5e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # replaces ix_venues_state_city: same leading columns for the browse filters, plus the order of the availability
+    # results so that its LIMIT can stop early
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venues_state_city_name', 'venues', ['state', 'city', 'name', 'id'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NULL'), postgresql_concurrently=True)
+        op.drop_index('ix_venues_state_city', table_name='venues', postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venues_state_city', 'venues', ['state', 'city'], unique=False,
+                        postgresql_where=sa.text('deleted_at IS NULL'), postgresql_concurrently=True)
+        op.drop_index('ix_venues_state_city_name', table_name='venues', postgresql_concurrently=True)
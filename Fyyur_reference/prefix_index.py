@@ -0,0 +1,77 @@
+import bisect
+import re
+import threading
+import time
+
+class PrefixIndex:
+    """In-memory sorted arrays of names for search-as-you-type, one array per kind (venue, artist).
+
+    Every word of a name gets one entry, so "hop" and "musical" both find "The Musical Hop".
+    A lookup is a bisect plus a scan of at most the matching entries, stopping at the limit;
+    adds and removes keep the arrays sorted so the index is updated in place as venues and
+    artists are created or deleted.
+    """
+
+    def __init__(self):
+        self._keys = {}         # kind -> sorted [(folded name from a word start, id)]
+        self._entries = {}      # (kind, id) -> (name, [keys]) so removal doesn't need the name
+        self._lock = threading.Lock()
+        self.built_at = None    # time.monotonic() of the last rebuild
+
+    @staticmethod
+    def _keys_for(entity_id, name):
+        folded = name.casefold()
+        return [(folded[match.start():], entity_id) for match in re.finditer(r'\w+', folded)]
+
+    def rebuild(self, entries):
+        # entries: iterable of (kind, id, name)
+        keys, by_entity = {}, {}
+        for kind, entity_id, name in entries:
+            entity_keys = self._keys_for(entity_id, name)
+            keys.setdefault(kind, []).extend(entity_keys)
+            by_entity[(kind, entity_id)] = (name, entity_keys)
+        for kind_keys in keys.values():
+            kind_keys.sort()
+        with self._lock:
+            self._keys, self._entries, self.built_at = keys, by_entity, time.monotonic()
+
+    def add(self, kind, entity_id, name):
+        with self._lock:
+            self._remove(kind, entity_id)
+            entity_keys = self._keys_for(entity_id, name)
+            kind_keys = self._keys.setdefault(kind, [])
+            for key in entity_keys:
+                bisect.insort(kind_keys, key)
+            self._entries[(kind, entity_id)] = (name, entity_keys)
+
+    def remove(self, kind, entity_id):
+        with self._lock:
+            self._remove(kind, entity_id)
+
+    def _remove(self, kind, entity_id):
+        name, entity_keys = self._entries.pop((kind, entity_id), (None, []))
+        kind_keys = self._keys.get(kind, [])
+        for key in entity_keys:
+            position = bisect.bisect_left(kind_keys, key)
+            if position < len(kind_keys) and kind_keys[position] == key:
+                del kind_keys[position]
+
+    def search(self, prefix, limit=10):
+        # returns {kind: [{'id': .., 'name': ..}]}, at most `limit` per kind, ordered by the matching word
+        prefix = prefix.strip().casefold()
+        results = {kind: [] for kind in self._keys}
+        if not prefix:
+            return results
+        with self._lock:
+            for kind, kind_keys in self._keys.items():
+                matches, seen = results[kind], set()
+                position = bisect.bisect_left(kind_keys, (prefix,))
+                while position < len(kind_keys) and len(matches) < limit:
+                    folded, entity_id = kind_keys[position]
+                    if not folded.startswith(prefix):
+                        break
+                    position += 1
+                    if entity_id not in seen:     # several words of one name can match the same prefix
+                        seen.add(entity_id)
+                        matches.append({'id': entity_id, 'name': self._entries[(kind, entity_id)][0]})
+        return results
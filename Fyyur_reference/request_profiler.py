@@ -0,0 +1,107 @@
+import cProfile
+import datetime
+import os
+import pstats
+import re
+import threading
+
+class RequestProfiler:
+    """cProfile runs of single requests, saved as a pstats file plus a collapsed-stack file for flamegraph tools
+    (flamegraph.pl, speedscope), keeping the most recent ones in one directory.
+
+    Profiling is asked for per request (signed header) or armed for the next few requests from the admin page.
+    Nothing is set up until a request asks for it, so an idle profiler costs the check of one integer.
+    """
+
+    def __init__(self, directory, keep=100):
+        self.directory, self.keep = directory, keep
+        self.armed = 0          # requests still to profile, see arm()
+        self._lock = threading.Lock()
+
+    def arm(self, requests):
+        with self._lock:
+            self.armed = requests
+
+    def take(self):
+        # True when this request should be profiled because of arm()
+        if not self.armed:      # unlocked fast path, a stale read only delays the next profile
+            return False
+        with self._lock:
+            if self.armed:
+                self.armed -= 1
+                return True
+        return False
+
+    def start(self):
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def save(self, profile, route, duration_ms):
+        # stop the profile and write <time>-<route>-<ms>ms.pstats / .collapsed; returns the common file name stem
+        profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        stem = '{}-{}-{}ms'.format(datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f'), re.sub(r'\W', '_', route or 'none'),
+                                   int(duration_ms))
+        profile.dump_stats(os.path.join(self.directory, stem + '.pstats'))
+        with open(os.path.join(self.directory, stem + '.collapsed'), 'w') as collapsed:
+            for stack, microseconds in self.collapsed_stacks(pstats.Stats(profile)):
+                collapsed.write(stack + ' ' + str(microseconds) + '\n')
+        self._prune()
+        return stem
+
+    def profiles(self):
+        # saved profiles, newest first: [{'name', 'route', 'duration_ms', 'at'}]
+        if not os.path.isdir(self.directory):
+            return []
+        listed = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            match = re.match(r'(\d{8}T\d{12})-(.*)-(\d+)ms\.pstats$', name)
+            if match:
+                listed.append({'name': name[:-len('.pstats')], 'route': match.group(2), 'duration_ms': int(match.group(3)),
+                               'at': datetime.datetime.strptime(match.group(1), '%Y%m%dT%H%M%S%f')})
+        return listed
+
+    def _prune(self):
+        for profile in self.profiles()[self.keep:]:
+            for suffix in ('.pstats', '.collapsed'):
+                try:
+                    os.remove(os.path.join(self.directory, profile['name'] + suffix))
+                except FileNotFoundError:      # another worker pruned it first
+                    pass
+
+    @staticmethod
+    def collapsed_stacks(stats):
+        # cProfile keeps caller -> callee edges, not whole stacks: walk the call graph from the roots and share each
+        # function's time among the paths that reach it in proportion to the time of each edge. Yields
+        # ("root;caller;function", microseconds of own time on that path)
+        def label(function):
+            filename, line, name = function
+            return name if filename == '~' else '{} ({}:{})'.format(name, os.path.basename(filename), line)
+        callees = {}
+        for function, (_, _, _, _, callers) in stats.stats.items():
+            for caller, edge in callers.items():
+                callees.setdefault(caller, []).append((function, edge[3]))
+        totals = {}
+
+        def walk(function, share, path, on_path):
+            own, cumulative = stats.stats[function][2], stats.stats[function][3]
+            if share < 0.000001 or not cumulative:     # under a microsecond: not worth a frame, and keeps the walk short
+                return
+            fraction = share / cumulative
+            stack = path + [label(function)]
+            key = ';'.join(stack)
+            totals[key] = totals.get(key, 0) + own * fraction
+            for callee, edge_time in callees.get(function, []):
+                if callee not in on_path:   # recursion: its time is in the outer call already
+                    walk(callee, edge_time * fraction, stack, on_path | {callee})
+
+        for function, (_, _, _, cumulative, callers) in stats.stats.items():
+            # the roots: time of calls from frames entered before the profile started, which have no caller edge.
+            # A function called that way and also from a profiled one (fib(), or a helper the view calls again)
+            # has callers and still such time of its own. Recursive edges are inside its cumulative time already
+            walk(function, cumulative - sum(edge[3] for caller, edge in callers.items() if caller != function), [], {function})
+        for stack, seconds in totals.items():
+            microseconds = int(seconds * 1000000)
+            if microseconds:
+                yield stack, microseconds
@@ -0,0 +1,119 @@
+import datetime
+import json
+import logging
+import queue
+import random
+import re
+import threading
+
+# functions (and keywords followed by a parenthesis) that only read. EXPLAIN ANALYZE executes the statement, so a
+# SELECT calling anything else (fyyur_create_show_partition(), nextval(), pg_advisory_lock(), ...) is not explained
+READ_ONLY_CALLS = frozenset("""
+    select from where and or not in exists any all values as on using join lateral filter over partition cast
+    count sum min max avg array_agg string_agg bool_or bool_and every coalesce nullif greatest least
+    lower upper length substring position concat trim abs round floor ceil extract date_part date_trunc now
+    tsrange int4range upper_inf lower_inf isempty websearch_to_tsquery plainto_tsquery to_tsquery to_tsvector
+    ts_rank ts_rank_cd unnest generate_series cardinality array_length row_number rank dense_rank
+    json_agg jsonb_agg json_build_object jsonb_build_object to_char make_interval
+""".split())
+
+class SlowQueryLog:
+    """Statements slower than a threshold: one JSON line each through `handler` (the queue of
+    structured_logging.start_pipeline(), so the request thread never writes the file), and totals per statement
+    (the SQL text, with its placeholders) for the admin page.
+
+    A sample of the slow SELECTs that only read (see explainable()) is explained again with EXPLAIN (ANALYZE,
+    BUFFERS) on a background thread, so the request that ran the statement never waits for it. The queue to that
+    thread is bounded: when it is full the sample is dropped rather than queued.
+    """
+
+    def __init__(self, handler, threshold_ms, explain=None, explain_sample=0.0):
+        # explain: callable(statement, parameters) returning the plan as text, run on the background thread
+        self.threshold_ms = threshold_ms
+        self._explain, self._explain_sample = explain, explain_sample
+        self._stats = {}        # statement -> {'count', 'total_ms', 'max_ms', 'route', 'plan'}
+        self._lock = threading.Lock()
+        self._pending = queue.Queue(maxsize=100)
+        self._worker = None
+        self._logger = logging.getLogger('fyyur.slow_queries')
+        self._logger.addHandler(handler)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+
+    @staticmethod
+    def redact(parameters):
+        # numbers, dates and None stay (ids and time windows are what reproduce a plan), text becomes its length
+        def value(parameter):
+            if isinstance(parameter, datetime.date):    # datetimes too
+                return parameter.isoformat()
+            if parameter is None or isinstance(parameter, (bool, int, float)):
+                return parameter
+            if isinstance(parameter, (list, tuple)):
+                return [value(item) for item in parameter]
+            return '<' + type(parameter).__name__ + ' ' + str(len(str(parameter))) + '>'
+        if isinstance(parameters, dict):
+            return {key: value(parameter) for key, parameter in parameters.items()}
+        return value(parameters) if parameters is not None else None
+
+    @staticmethod
+    def redact_plan(plan):
+        # EXPLAIN ANALYZE prints the bound values in its filters: the text constants become '?' as in redact()
+        return re.sub(r"'(?:[^']|'')*'::(text|character varying|bpchar)\b", r"'?'::\1", plan)
+
+    @staticmethod
+    def explainable(statement):
+        # a SELECT that EXPLAIN ANALYZE may run again: no row locks (FOR UPDATE / FOR SHARE ...) and no calls
+        # outside READ_ONLY_CALLS. String constants are left out of the check
+        if not statement.lstrip().upper().startswith('SELECT'):
+            return False
+        code = re.sub(r"'(?:[^']|'')*'", "''", statement)
+        if re.search(r'\bFOR\s+(NO\s+KEY\s+)?(UPDATE|KEY\s+SHARE|SHARE)\b', code, re.IGNORECASE):
+            return False
+        return all(name.lower() in READ_ONLY_CALLS for name in re.findall(r'\b([A-Za-z_][A-Za-z0-9_$.]*)\s*\(', code))
+
+    def record(self, statement, parameters, duration_ms, route):
+        # called for every statement; only the slow ones cost more than the comparison
+        if duration_ms < self.threshold_ms:
+            return
+        with self._lock:
+            stats = self._stats.setdefault(statement, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'route': None, 'plan': None})
+            stats['count'] += 1
+            stats['total_ms'] += duration_ms
+            stats['max_ms'] = max(stats['max_ms'], duration_ms)
+            stats['route'] = route
+        self._write({'event': 'slow_query', 'route': route, 'duration_ms': round(duration_ms, 2), 'statement': statement,
+                     'parameters': self.redact(parameters)})
+        if self._explain and random.random() < self._explain_sample and self.explainable(statement):
+            try:
+                self._pending.put_nowait((statement, parameters, route))
+            except queue.Full:
+                return
+            self._start_worker()
+
+    def top(self, limit=50):
+        # statements by total time, the ones that cost the most overall first
+        with self._lock:
+            rows = [dict(stats, statement=statement, mean_ms=stats['total_ms'] / stats['count']) for statement, stats in self._stats.items()]
+        return sorted(rows, key=lambda row: row['total_ms'], reverse=True)[:limit]
+
+    def _write(self, entry):
+        entry['at'] = datetime.datetime.now().isoformat()
+        self._logger.info(json.dumps(entry, default=str))
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='slow-query-explain', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            statement, parameters, route = self._pending.get()
+            try:
+                plan = self.redact_plan(self._explain(statement, parameters))
+            except Exception as error:      # the statement may be gone stale (rows deleted, schema changed)
+                plan = 'EXPLAIN failed: ' + str(error)
+            with self._lock:
+                if statement in self._stats:
+                    self._stats[statement]['plan'] = plan
+            self._write({'event': 'explain', 'route': route, 'statement': statement, 'plan': plan})
@@ -2,3 +2,28 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// search-as-you-type: fill the datalist of the navbar search box from /api/v1/autocomplete
+document.querySelectorAll('input[data-autocomplete]').forEach(function (input) {
+  var suggestions = document.getElementById(input.getAttribute('list'));
+  var pending;
+  input.addEventListener('input', function () {
+    clearTimeout(pending);
+    pending = setTimeout(function () {
+      if (!input.value.trim()) {
+        suggestions.innerHTML = '';
+        return;
+      }
+      fetch('/api/v1/autocomplete?q=' + encodeURIComponent(input.value))
+        .then(function (response) { return response.json(); })
+        .then(function (data) {
+          suggestions.innerHTML = '';
+          data[input.dataset.autocomplete].forEach(function (match) {
+            var option = document.createElement('option');
+            option.value = match.name;
+            suggestions.appendChild(option);
+          });
+        });
+    }, 100);
+  });
+});
@@ -0,0 +1,66 @@
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+
+# attributes copied from a record into its JSON line when set, e.g. by extra= or a filter
+FIELDS = ('request_id', 'trace_id', 'route', 'method', 'path', 'status', 'latency_ms', 'sql_statements', 'sql_ms', 'template_ms')
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, the FIELDS present and the traceback if any."""
+
+    def format(self, record):
+        entry = {'at': datetime.datetime.fromtimestamp(record.created).isoformat(), 'level': record.levelname,
+                 'logger': record.name, 'message': record.getMessage()}
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler onto a bounded queue that never stalls the logging thread for long.
+
+    When the queue is full, records below WARNING are dropped at once. Warnings and errors wait up to
+    `block_seconds` for room and are dropped after that. Drops are counted in `dropped` and passed to `on_drop`.
+    Records are prepared in the logging thread (message merged, traceback as text) so the listener needs nothing
+    from the request.
+    """
+
+    def __init__(self, records, block_seconds=0.05, on_drop=None):
+        super().__init__(records)
+        self.block_seconds, self.on_drop = block_seconds, on_drop
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= logging.WARNING:
+                self.queue.put(record, timeout=self.block_seconds)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.on_drop:
+                self.on_drop(record)
+
+def start_pipeline(path, max_bytes, backups, queue_size, block_seconds=0.05, on_drop=None, formatter=None):
+    # the request threads only enqueue; a QueueListener thread formats the lines (JsonFormatter unless given) and
+    # writes the rotating file, created at the first record. Returns (handler to add to loggers, listener to stop at exit)
+    records = queue.Queue(maxsize=queue_size)
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+    file_handler.setFormatter(formatter or JsonFormatter())
+    listener = logging.handlers.QueueListener(records, file_handler, respect_handler_level=True)
+    listener.start()
+    return DroppingQueueHandler(records, block_seconds, on_drop), listener
@@ -0,0 +1,58 @@
+"""MemoryProfiler: the armed requests are counted off only when they get measured.
+
+No database needed:
+
+    $ python3 -m unittest -v test_memory_profiler
+"""
+import tracemalloc
+import unittest
+
+from memory_profiler import MemoryProfiler
+
+class MemoryProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = MemoryProfiler()
+
+    def tearDown(self):
+        if self.profiler._started_tracing:
+            tracemalloc.stop()
+
+    def test_nothing_taken_unless_armed_or_sampled(self):
+        self.assertFalse(self.profiler.take())
+        self.assertFalse(MemoryProfiler(sample_rate=0.0).take())
+        self.assertTrue(MemoryProfiler(sample_rate=1.0).take())
+
+    def test_armed_requests_are_measured_then_tracing_stops(self):
+        self.profiler.arm(2)
+        for left in (1, 0):
+            self.assertTrue(self.profiler.take())
+            started = self.profiler.start()
+            self.assertIsNotNone(started)
+            self.assertEqual(self.profiler.armed, left)
+            data = [bytearray(1000) for _ in range(10)]
+            peak, retained = self.profiler.finish(started, 'venues')
+            self.assertGreaterEqual(peak, 10000)
+        self.assertFalse(self.profiler.take())
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual(self.profiler.routes()[0]['count'], 2)
+
+    def test_request_not_measured_keeps_its_place(self):
+        # a request that finds another one being measured is not counted off the armed ones
+        self.profiler.arm(2)
+        started = self.profiler.start()
+        self.assertEqual(self.profiler.armed, 1)
+        self.assertTrue(self.profiler.take())
+        self.assertIsNone(self.profiler.start())
+        self.assertEqual(self.profiler.armed, 1)
+        self.profiler.finish(started, 'venues')
+        self.assertIsNotNone(self.profiler.start())
+        self.assertEqual(self.profiler.armed, 0)
+
+    def test_arm_zero_disarms(self):
+        self.profiler.arm(5)
+        self.profiler.arm(0)
+        self.assertFalse(self.profiler.take())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""PrefixIndex: search-as-you-type over the words of the names, updated in place.
+
+No database needed:
+
+    $ python3 -m unittest -v test_prefix_index
+"""
+import unittest
+
+from prefix_index import PrefixIndex
+
+class PrefixIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.rebuild([('venues', 1, 'The Musical Hop'), ('venues', 2, 'Park Square Live Music & Coffee'),
+                            ('venues', 3, 'The Dueling Pianos Bar'), ('artists', 1, 'Guns N Petals')])
+
+    def ids(self, prefix, kind='venues', limit=10):
+        return [match['id'] for match in self.index.search(prefix, limit)[kind]]
+
+    def test_any_word_of_the_name(self):
+        self.assertEqual(self.ids('hop'), [1])
+        self.assertEqual(self.ids('musical'), [1])
+        self.assertEqual(self.ids('the'), [3, 1])        # ordered by the matching word: "the dueling" < "the musical"
+        self.assertEqual(self.index.search('pet')['artists'], [{'id': 1, 'name': 'Guns N Petals'}])
+
+    def test_case_and_spaces_ignored(self):
+        self.assertEqual(self.ids('  MUS '), [2, 1])     # "music & coffee" < "musical hop"
+
+    def test_a_name_listed_once(self):
+        # all three words of venue 4 match: it is listed once, where its first match sorts
+        self.index.add('venues', 4, 'Music Music Music')
+        self.assertEqual(self.ids('music'), [4, 2, 1])
+
+    def test_limit(self):
+        self.assertEqual(self.ids('mus', limit=1), [2])
+
+    def test_no_prefix_no_match(self):
+        self.assertEqual(self.index.search(''), {'venues': [], 'artists': []})
+        self.assertEqual(self.ids('zzz'), [])
+
+    def test_add_and_remove(self):
+        self.index.add('artists', 2, 'Matt Quevedo')
+        self.assertEqual(self.ids('que', 'artists'), [2])
+        self.index.add('artists', 2, 'Matt Quevado Trio')      # renamed: the old words go
+        self.assertEqual(self.ids('quevedo', 'artists'), [])
+        self.assertEqual(self.ids('trio', 'artists'), [2])
+        self.index.remove('venues', 1)
+        self.assertEqual(self.ids('the'), [3])
+        self.index.remove('venues', 99)      # unknown ids are ignored
+        self.assertEqual(self.ids('park'), [2])
+
+if __name__ == '__main__':
+    unittest.main()
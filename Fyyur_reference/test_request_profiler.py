@@ -0,0 +1,71 @@
+"""RequestProfiler: collapsed stacks for the flame graphs, and the profiles kept on disk.
+
+No database needed:
+
+    $ python3 -m unittest -v test_request_profiler
+"""
+import os
+import pstats
+import tempfile
+import types
+import unittest
+
+from request_profiler import RequestProfiler
+
+MAIN, WORK, HELPER, LEN = ('/app/app.py', 1, 'main'), ('/app/app.py', 5, 'work'), ('/app/helpers.py', 9, 'helper'), ('~', 0, '<built-in method len>')
+
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+class CollapsedStacksTest(unittest.TestCase):
+
+    def test_time_shared_by_the_callers(self):
+        # main (1s) calls work, helper and len; work calls helper too. pstats: function -> (cc, nc, own, cumulative,
+        # {caller: (cc, nc, own, cumulative) of the edge}), in seconds that add up exactly in binary
+        stats = types.SimpleNamespace(stats={
+            MAIN: (1, 1, 0.125, 1.0, {}),
+            WORK: (1, 1, 0.3125, 0.5, {MAIN: (1, 1, 0.3125, 0.5)}),
+            HELPER: (4, 4, 0.25, 0.25, {MAIN: (1, 1, 0.0625, 0.0625), WORK: (3, 3, 0.1875, 0.1875)}),
+            LEN: (1, 1, 0.3125, 0.3125, {MAIN: (1, 1, 0.3125, 0.3125)}),
+        })
+        self.assertEqual(dict(RequestProfiler.collapsed_stacks(stats)), {
+            'main (app.py:1)': 125000,
+            'main (app.py:1);work (app.py:5)': 312500,
+            'main (app.py:1);work (app.py:5);helper (helpers.py:9)': 187500,
+            'main (app.py:1);helper (helpers.py:9)': 62500,
+            'main (app.py:1);<built-in method len>': 312500,
+        })
+
+    def test_recursion_not_walked_again(self):
+        profile = RequestProfiler('unused').start()
+        fib(18)
+        profile.disable()
+        stacks = dict(RequestProfiler.collapsed_stacks(pstats.Stats(profile)))
+        fib_stacks = [stack for stack in stacks if 'fib (' in stack]
+        self.assertTrue(fib_stacks)
+        for stack in fib_stacks:
+            self.assertEqual(stack.count('fib ('), 1, stack)
+
+class SavedProfilesTest(unittest.TestCase):
+
+    def test_save_lists_and_prunes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = RequestProfiler(directory, keep=2)
+            stems = []
+            for duration_ms in (10, 20, 30):
+                profile = profiler.start()
+                fib(10)
+                stems.append(profiler.save(profile, 'show/venue', duration_ms))
+            self.assertEqual([profile['name'] for profile in profiler.profiles()], stems[:0:-1])
+            self.assertEqual(profiler.profiles()[0]['route'], 'show_venue')
+            self.assertEqual(profiler.profiles()[0]['duration_ms'], 30)
+            self.assertEqual(sorted(os.listdir(directory)), sorted(stem + suffix for stem in stems[1:] for suffix in ('.pstats', '.collapsed')))
+
+    def test_armed_requests_counted_off(self):
+        profiler = RequestProfiler('unused')
+        self.assertFalse(profiler.take())
+        profiler.arm(2)
+        self.assertEqual([profiler.take() for _ in range(3)], [True, True, False])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""structured_logging: the JSON lines, and the bounded queue that drops records instead of stalling a request.
+
+No database needed:
+
+    $ python3 -m unittest -v test_structured_logging
+"""
+import json
+import logging
+import os
+import queue
+import sys
+import tempfile
+import time
+import unittest
+
+from structured_logging import DroppingQueueHandler, JsonFormatter, start_pipeline
+
+def make_record(level=logging.INFO, message='listed %s', args=('venue 1',), exc_info=None, **extra):
+    record = logging.LogRecord('fyyur', level, 'app.py', 1, message, args, exc_info)
+    record.__dict__.update(extra)
+    return record
+
+class JsonFormatterTest(unittest.TestCase):
+
+    def test_fields_present(self):
+        entry = json.loads(JsonFormatter().format(make_record(request_id='abc', status=200, latency_ms=12.5, route=None)))
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual(entry['logger'], 'fyyur')
+        self.assertEqual(entry['message'], 'listed venue 1')
+        self.assertEqual((entry['request_id'], entry['status'], entry['latency_ms']), ('abc', 200, 12.5))
+        self.assertNotIn('route', entry)      # unset fields are left out
+        self.assertNotIn('exception', entry)
+
+    def test_traceback(self):
+        try:
+            raise ValueError('bad venue')
+        except ValueError:
+            record = make_record(logging.ERROR, exc_info=sys.exc_info())
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertIn('ValueError: bad venue', entry['exception'])
+
+class DroppingQueueHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dropped = []
+        self.handler = DroppingQueueHandler(queue.Queue(maxsize=1), block_seconds=0.2, on_drop=self.dropped.append)
+
+    def test_prepared_for_the_listener(self):
+        self.handler.handle(make_record())
+        record = self.handler.queue.get_nowait()
+        self.assertEqual((record.msg, record.args, record.message), ('listed venue 1', None, 'listed venue 1'))
+
+    def test_full_queue_drops_info_at_once(self):
+        self.handler.handle(make_record())
+        started = time.monotonic()
+        self.handler.handle(make_record(message='second', args=()))
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(self.handler.dropped, 1)
+        self.assertEqual([record.message for record in self.dropped], ['second'])
+
+    def test_full_queue_keeps_warnings_waiting_a_little(self):
+        self.handler.handle(make_record())
+        started = time.monotonic()
+        self.handler.handle(make_record(logging.WARNING))
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(self.handler.dropped, 1)
+
+class PipelineTest(unittest.TestCase):
+
+    def test_lines_written_by_the_listener(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'fyyur.log')
+            handler, listener = start_pipeline(path, max_bytes=1024 * 1024, backups=1, queue_size=100)
+            logger = logging.getLogger('fyyur.test_structured_logging')
+            logger.addHandler(handler)
+            logger.propagate = False
+            try:
+                logger.warning('slow %s', 'page', extra={'route': 'venues'})
+            finally:
+                listener.stop()     # drains the queue
+                logger.removeHandler(handler)
+            with open(path) as log:
+                entries = [json.loads(line) for line in log]
+        self.assertEqual([(entry['message'], entry['route'], entry['level']) for entry in entries], [('slow page', 'venues', 'WARNING')])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""tracing: the traceparent header a request comes with and the one it answers with.
+
+No database needed:
+
+    $ python3 -m unittest -v test_tracing
+"""
+import unittest
+
+from tracing import Tracer, parse_traceparent
+
+TRACE_ID, PARENT_ID = '4bf92f3577b34da6a3ce929d0e0e4736', '00f067aa0ba902b7'
+
+class Spans(list):
+    # exporter keeping the spans of the finished traces
+    def export(self, spans):
+        self.extend(spans)
+
+class TraceparentTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_traceparent('00-' + TRACE_ID + '-' + PARENT_ID + '-01'), (TRACE_ID, PARENT_ID, True))
+        self.assertEqual(parse_traceparent('00-' + TRACE_ID + '-' + PARENT_ID + '-00'), (TRACE_ID, PARENT_ID, False))
+
+    def test_invalid(self):
+        for value in (None, '', 'garbage', '01-' + TRACE_ID + '-' + PARENT_ID + '-01', '00-' + TRACE_ID.upper() + '-' + PARENT_ID + '-01',
+                      '00-' + TRACE_ID + '-' + PARENT_ID + '-01-extra', '00-' + '0' * 32 + '-' + PARENT_ID + '-01',
+                      '00-' + TRACE_ID + '-' + '0' * 16 + '-01'):
+            with self.subTest(value=value):
+                self.assertIsNone(parse_traceparent(value))
+
+    def test_continues_the_callers_trace(self):
+        tracer = Tracer(Spans(), sample_rate=0.0)
+        trace = tracer.start('00-' + TRACE_ID + '-' + PARENT_ID + '-01')
+        self.assertEqual((trace.trace_id, trace.parent_id), (TRACE_ID, PARENT_ID))
+        self.assertRegex(trace.traceparent(), '^00-' + TRACE_ID + '-[0-9a-f]{16}-01$')
+        self.assertNotEqual(trace.traceparent().split('-')[2], PARENT_ID)
+        tracer.finish(trace, 'GET /venues')
+        self.assertEqual(tracer.exporter[-1]['parentSpanId'], PARENT_ID)
+
+    def test_caller_not_sampling(self):
+        self.assertIsNone(Tracer(Spans(), sample_rate=1.0).start('00-' + TRACE_ID + '-' + PARENT_ID + '-00'))
+
+    def test_zero_ids_start_a_new_trace(self):
+        for traceparent in ('00-' + '0' * 32 + '-' + PARENT_ID + '-01', '00-' + TRACE_ID + '-' + '0' * 16 + '-01'):
+            with self.subTest(traceparent=traceparent):
+                self.assertIsNone(Tracer(Spans(), sample_rate=0.0).start(traceparent))
+                trace = Tracer(Spans(), sample_rate=1.0).start(traceparent)
+                self.assertIsNone(trace.parent_id)
+                self.assertNotIn(trace.trace_id, (TRACE_ID, '0' * 32))
+                self.assertRegex(trace.traceparent(), '^00-[0-9a-f]{32}-[0-9a-f]{16}-01$')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')    # W3C trace context, version 00
+
+def parse_traceparent(value):
+    # (trace_id, parent_id, sampled) of a traceparent header, or None when it is missing or invalid. All-zero ids are
+    # invalid (W3C trace context): such a request starts a trace of its own
+    match = TRACEPARENT.match(value or '')
+    if not match or not int(match.group(1), 16) or not int(match.group(2), 16):
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+class Trace:
+    """The spans of one sampled request: the request span and its children (SQL, templates, cache lookups).
+
+    Children are added with perf_counter() readings, which are cheap, and converted to wall clock nanoseconds
+    against the start of the trace. At most `max_spans` children are kept, the rest are only counted.
+    """
+
+    def __init__(self, trace_id, parent_id, max_spans):
+        self.trace_id, self.parent_id, self.span_id = trace_id, parent_id, '%016x' % random.getrandbits(64)
+        self.max_spans, self.dropped = max_spans, 0
+        self.spans = []
+        self._started, self._started_ns = time.perf_counter(), time.time_ns()
+
+    def add(self, name, started, ended, attributes=None):
+        # started, ended: time.perf_counter() readings
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        self.spans.append(self._span(name, '%016x' % random.getrandbits(64), self.span_id, started, ended, attributes))
+
+    def finish(self, name, attributes=None):
+        # closes the request span; returns all spans of the trace
+        attributes = dict(attributes or {}, **({'spans.dropped': self.dropped} if self.dropped else {}))
+        self.spans.append(self._span(name, self.span_id, self.parent_id, self._started, time.perf_counter(), attributes))
+        return self.spans
+
+    def traceparent(self):
+        return '00-{}-{}-01'.format(self.trace_id, self.span_id)
+
+    def _span(self, name, span_id, parent_id, started, ended, attributes):
+        return {'traceId': self.trace_id, 'spanId': span_id, 'parentSpanId': parent_id or '', 'name': name,
+                'startTimeUnixNano': self._started_ns + int((started - self._started) * 1e9),
+                'endTimeUnixNano': self._started_ns + int((ended - self._started) * 1e9),
+                'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in (attributes or {}).items()]}
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+class Tracer:
+    """Starts a Trace for the sampled requests. A valid incoming traceparent decides by its sampled flag (the caller
+    already chose), otherwise `sample_rate` does. Unsampled requests get no Trace and record nothing."""
+
+    def __init__(self, exporter, sample_rate, max_spans=1000):
+        self.exporter, self.sample_rate, self.max_spans = exporter, sample_rate, max_spans
+
+    def start(self, traceparent=None):
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, sampled = parent
+            return Trace(trace_id, parent_id, self.max_spans) if sampled else None
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        return Trace('%032x' % random.getrandbits(128), None, self.max_spans)
+
+    def finish(self, trace, name, attributes=None):
+        self.exporter.export(trace.finish(name, attributes))
+
+class BatchExporter:
+    """Spans queued by the requests and written by a background thread, in batches of up to `batch_size` or every
+    `interval` seconds, as one OTLP/JSON line per batch (the layout of the OpenTelemetry collector's file
+    exporter) in a size-rotated file. A full queue drops spans instead of waiting; `dropped` counts them.
+    """
+
+    def __init__(self, path, batch_size=512, interval=5.0, queue_size=10000, max_bytes=50 * 1024 * 1024, backups=5):
+        self.batch_size, self.interval = batch_size, interval
+        self.dropped = 0
+        self._pending = queue.Queue(maxsize=queue_size)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self._logger = logging.getLogger('fyyur.traces.' + path)
+        self._logger.addHandler(handler)
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._worker = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._worker.start()
+
+    def export(self, spans):
+        for span in spans:
+            try:
+                self._pending.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        # write everything queued so far and wait for it (tests, shutdown); False when the writer did not get to it
+        written = threading.Event()
+        self._pending.put(written, timeout=timeout)
+        return written.wait(timeout)
+
+    def _run(self):
+        while True:
+            batch, deadline, flushed = [], time.monotonic() + self.interval, None
+            while len(batch) < self.batch_size and flushed is None:
+                try:
+                    span = self._pending.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if isinstance(span, threading.Event):
+                    flushed = span
+                else:
+                    batch.append(span)
+            self._write(batch)
+            if flushed:
+                flushed.set()
+
+    def _write(self, batch):
+        if batch:
+            self._logger.info(json.dumps({'resourceSpans': [{
+                'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'fyyur'}}]},
+                'scopeSpans': [{'scope': {'name': 'fyyur'}, 'spans': batch}]}]}))